@@ -0,0 +1,627 @@
+#!/usr/bin/env python3
+"""
+Benchmarks and regression checks for the overlay burner.
+
+Run from the common/ directory:
+    python3 benchmark.py sei-scan [--size-mb 1024]
+    python3 benchmark.py suite [--quick] [--out results.json] [--baseline old.json]
+
+sei-scan builds a synthetic Annex B stream in memory (slices with a Dividia
+SEI record in front of every keyframe; up to 64 MiB of distinct chunks,
+repeated for larger sizes) before timing anything, then feeds it in 1 MiB
+chunks through both the legacy find_sei() loop and SeiScanner, reporting
+throughput and the number of records each one sees. The legacy loop rescans its 100 KB carry-over
+buffer, stops at the first record in each buffer and only recognises 4-byte
+start codes, so its count is the number of chunks in which it saw a record.
+
+suite generates H.264 and HEVC clips with the system ffmpeg (testsrc, libx264
+or libx265) and injects Dividia SEI records into them, varying resolution,
+length and where the records sit: before every keyframe, before the first
+one only, or only from a few GOPs in. Each clip is probed with find_sei(),
+probe_sei() and the native MP4 reader and burned with process(), then the
+whole folder is run through main() --headless. Every measurement runs in a
+fresh child process so its peak RSS is its own. Results (MB/s, fps,
+seconds, peak RSS, and whether the injected camera and time were found) are
+written as JSON; --baseline prints the change against an earlier results
+file. The run fails if any clip's metadata is misread or any burn fails.
+
+suite then runs regression checks for cases that once broke:
+- a Dividia record that doesn't parse must not stop the mapped probe
+- a clip encoded in segments (OVERLAY_SEGMENTS) must keep every frame and
+  show the same clock at each join as the clip encoded whole
+- several --worker processes sharing a folder must burn every clip once and
+  leave no lease or partial files, and a clip whose worker is killed
+  mid-encode must be taken over once its lease expires
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import overlay_burner as ob
+
+CHUNK_SIZE = 1048576
+SCAN_DISTINCT_MB = 64  # Distinct chunks sei-scan generates; larger streams repeat them
+
+def escape_rbsp(data):
+    """Insert emulation-prevention bytes so the payload can't fake a start code"""
+    out = bytearray()
+    zeros = 0
+    for b in data:
+        if zeros >= 2 and b <= 3:
+            out.append(3)
+            zeros = 0
+        out.append(b)
+        zeros = zeros + 1 if b == 0 else 0
+    return bytes(out)
+
+def dividia_sei_nal(seconds_today, camera=b"Front Door", start_code=b'\x00\x00\x00\x01', codec="h264"):
+    """Build an SEI NAL unit (H.264, or HEVC prefix SEI) carrying a Dividia metadata record"""
+    payload = (b'\xaa\xff' * 8 + b'\xaa\xaa\xab\xb2' + b'\x02\x00\xc8\x00' +
+               struct.pack('<H', seconds_today) + b'\x1ci' + camera)
+    payload += b'\x00' * (104 - len(payload))
+    return start_code + ob.CODECS[codec]["sei_header"] + escape_rbsp(b'\x05' + bytes([len(payload)]) + payload + b'\x80')
+
+def slice_nal(size, keyframe, start_code=b'\x00\x00\x01'):
+    """Build a slice NAL unit filled with random (escaped) data"""
+    return start_code + (b'\x65' if keyframe else b'\x41') + escape_rbsp(os.urandom(size))
+
+def synthetic_gop(seconds_today, gop_size=25, slice_size=40000):
+    """One GOP: SEI record, IDR slice, then P slices.
+
+    Odd GOPs open with an access unit delimiter so their SEI carries a
+    3-byte start code, as muxers emit for NAL units after the first.
+    """
+    if seconds_today % 2:
+        parts = [b'\x00\x00\x00\x01\x09\xf0', dividia_sei_nal(seconds_today, start_code=b'\x00\x00\x01')]
+    else:
+        parts = [dividia_sei_nal(seconds_today)]
+    parts.append(slice_nal(slice_size * 4, True))
+    parts += [slice_nal(slice_size, False) for _ in range(gop_size - 1)]
+    return b"".join(parts)
+
+def synthetic_stream(size_bytes, gops_in_pattern=8):
+    """Yield CHUNK_SIZE chunks of a repeating synthetic Annex B stream"""
+    pattern = b"".join(synthetic_gop(30000 + i) for i in range(gops_in_pattern))
+    stream_pos = 0
+    carry = b""
+    while stream_pos < size_bytes:
+        data = carry + pattern
+        for off in range(0, len(data) - CHUNK_SIZE + 1, CHUNK_SIZE):
+            yield data[off:off + CHUNK_SIZE]
+            stream_pos += CHUNK_SIZE
+            if stream_pos >= size_bytes:
+                return
+        carry = data[len(data) - len(data) % CHUNK_SIZE:]
+
+def bench_legacy(chunks):
+    """The pre-SeiScanner probe loop: append, find_sei() the whole buffer, keep the last 100 KB"""
+    chunk = b""
+    found = 0
+    for data in chunks:
+        chunk += data
+        n, t = ob.find_sei(chunk)
+        if n:
+            found += 1
+        chunk = chunk if len(chunk) < 100000 else chunk[-100000:]
+    return found
+
+def bench_scanner(chunks):
+    scanner = ob.SeiScanner()
+    found = 0
+    for data in chunks:
+        found += len(scanner.feed(data))
+    return found
+
+def run_sei_scan(args):
+    size_bytes = args.size_mb * CHUNK_SIZE
+    print(f"Synthetic Annex B stream: {args.size_mb} MiB, 1 MiB chunks")
+
+    # Generating the stream (random slices, escaping in Python) is far slower
+    # than scanning it, so the chunks are built before either timer starts.
+    # Past SCAN_DISTINCT_MB the same chunks are fed again.
+    distinct = list(synthetic_stream(min(size_bytes, SCAN_DISTINCT_MB * CHUNK_SIZE)))
+    chunks = [distinct[n % len(distinct)] for n in range(size_bytes // CHUNK_SIZE)]
+
+    for label, fn, note in (("find_sei (legacy)", bench_legacy, "chunks with a record"),
+                            ("SeiScanner", bench_scanner, "records")):
+        start = time.perf_counter()
+        found = fn(chunks)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(f"  {label:<18} {elapsed:7.2f}s  {args.size_mb / elapsed:9.1f} MiB/s  {found} {note}")
+
+# Suite clip matrix; --quick keeps the first entry of each
+CLIP_CODECS = ("h264", "hevc")
+RESOLUTIONS = ("640x360", "1280x720", "1920x1080")
+LENGTHS = (10, 60)                            # Seconds
+PLACEMENTS = ("keyframes", "first", "late")
+FRAME_RATE = 25
+GOP = 50                                      # Frames between keyframes
+LATE_KEYFRAME = 3                             # First keyframe with a record for "late"
+CLIP_START = 14 * 3600 + 2 * 60 + 13          # Recorder clock at the first frame (14:02:13)
+CLIP_CAMERA = "Bench Cam"
+SEGMENT_CHECK_SECONDS = 60                    # Length of the segmented-encode check clip
+SEGMENT_CHECK_COUNT = 4                       # OVERLAY_SEGMENTS for that check
+JOIN_FRAMES = 3                               # Frames compared on each side of a join
+MIN_CLOCK_PSNR = 30                           # dB; a clock one second off scores far lower
+WORKER_COUNT = 3                              # --worker processes sharing the check folder
+WORKER_CLIPS = 9
+WORKER_LEASE_SECONDS = 4                      # OVERLAY_LEASE_SECONDS for the takeover check
+
+def split_nals(stream):
+    """Split an Annex B stream into NAL units (without start codes)"""
+    nals = []
+    pos = stream.find(b'\x00\x00\x01')
+    while pos != -1:
+        start = pos + 3
+        pos = stream.find(b'\x00\x00\x01', start)
+        end = len(stream) if pos == -1 else pos
+        nals.append(stream[start:end].rstrip(b'\x00') if pos != -1 else stream[start:end])
+    return nals
+
+def make_clip(ffmpeg, out, size, seconds, placement, codec="h264"):
+    """Encode a test clip and inject a Dividia SEI record in front of keyframes.
+
+    Returns (annexb_bytes, expected_time): the raw stream as muxed, and the
+    clock the first record carries (HH:MM:SS).
+    """
+    if codec == "hevc":
+        encoder = ["-c:v", "libx265", "-preset", "ultrafast", "-x265-params",
+                   f"keyint={GOP}:min-keyint={GOP}:bframes=0:log-level=error"]
+    else:
+        encoder = ["-c:v", "libx264", "-preset", "ultrafast", "-g", str(GOP), "-bf", "0"]
+    raw = subprocess.run([ffmpeg, "-v", "error", "-f", "lavfi", "-i",
+                          f"testsrc=size={size}:rate={FRAME_RATE}:duration={seconds}"] + encoder +
+                         ["-bsf:v", ob.CODECS[codec]["bsf"], "-f", ob.CODECS[codec]["format"], "-"],
+                         capture_output=True, check=True).stdout
+    parts = []
+    keyframe = 0
+    first_clock = None
+    previous = None
+    if codec == "hevc":
+        nal_type_of = lambda nal: (nal[0] >> 1) & 0x3F
+        parameter_set, keyframe_slices, leading = 32, range(16, 22), {32, 33, 34, 35, 39, *range(16, 22)}  # VPS, IRAP
+    else:
+        nal_type_of = lambda nal: nal[0] & 0x1F
+        parameter_set, keyframe_slices, leading = 7, (5,), {5, 6, 7, 8}  # SPS, IDR
+    for nal in split_nals(raw):
+        nal_type = nal_type_of(nal)
+        # A keyframe's access unit opens with its parameter sets, or with the keyframe slice itself
+        if nal_type == parameter_set or (nal_type in keyframe_slices and previous not in leading):
+            if placement == "keyframes" or (placement == "first" and keyframe == 0) or \
+                    (placement == "late" and keyframe >= LATE_KEYFRAME):
+                clock = CLIP_START + keyframe * GOP // FRAME_RATE
+                first_clock = first_clock if first_clock is not None else clock
+                parts.append(dividia_sei_nal(clock, CLIP_CAMERA.encode(), codec=codec))
+            keyframe += 1
+        previous = nal_type
+        parts.append(b'\x00\x00\x00\x01' + nal)
+    stream = b"".join(parts)
+    subprocess.run([ffmpeg, "-v", "error", "-f", ob.CODECS[codec]["format"], "-framerate", str(FRAME_RATE), "-i", "-",
+                    "-c", "copy"] + (["-tag:v", "hvc1"] if codec == "hevc" else []) + ["-y", str(out)],
+                   input=stream, check=True)
+    return stream, time.strftime('%H:%M:%S', time.gmtime(first_clock))
+
+def peak_rss_kb(children=False):
+    """Peak resident set size of this process (or the largest of its finished children) in KiB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes
+
+def run_stage(args):
+    """Child process: run one measurement and write its result to args.result"""
+    path = Path(args.path)
+    result = {}
+    start = time.perf_counter()
+    if args.stage == "find_sei":
+        data = path.read_bytes()
+        start = time.perf_counter()
+        cam, ts = ob.find_sei(data, codec=args.codec)
+        result.update(camera=cam, found=ts, bytes=len(data))
+    elif args.stage == "probe":
+        # Read to EOF so the rate covers the whole file, not just up to the first record
+        cam, ts, bytes_read = ob.probe_sei(path, early_exit=False)
+        result.update(camera=cam, found=ts, bytes=path.stat().st_size)
+    elif args.stage == "mapped":
+        cam, ts, bytes_read = ob.scan_mapped_sei(path)
+        result.update(camera=cam, found=ts, bytes_read=bytes_read)
+    elif args.stage == "native":
+        cam, ts, bytes_read = ob.read_mp4_sei(path)
+        result.update(camera=cam, found=ts, bytes_read=bytes_read)
+    elif args.stage == "process":
+        status = ob.process(path)
+        plan = ob.plan_segments(path)
+        result.update(status=status, frames=ob.read_mp4_track(path).sample_count, segments=plan and plan[0])
+    elif args.stage == "main":
+        sys.argv = [sys.argv[0], str(path), "--headless"]
+        ob.main()
+    result.update(seconds=time.perf_counter() - start, peak_rss_kb=peak_rss_kb(children=False),
+                  ffmpeg_peak_rss_kb=peak_rss_kb(children=True))
+    Path(args.result).write_text(json.dumps(result))
+
+def measure(stage, path, ffmpeg, workdir, codec="h264", settings=None):
+    """Run one stage in a fresh interpreter (logs, index and RSS of its own) and return its result.
+
+    settings are extra OVERLAY_* environment variables for the child.
+    """
+    result_file = workdir / f"{stage}.result.json"
+    env = dict(os.environ, OVERLAY_INDEX="0", OVERLAY_FFMPEG=ffmpeg, **(settings or {}))
+    proc = subprocess.run([sys.executable, str(Path(__file__).resolve()), "_stage", stage, str(path),
+                           "--result", str(result_file), "--codec", codec],
+                          cwd=workdir, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE)
+    if proc.returncode != 0 or not result_file.exists():
+        return {"error": proc.stderr.decode(errors='ignore').strip().splitlines()[-1:]}
+    result = json.loads(result_file.read_text())
+    result_file.unlink()
+    return result
+
+def throughput(result):
+    """Add MB/s (or fps) to a stage result and say whether it is correct"""
+    if "bytes" in result and result.get("seconds"):
+        result["mb_s"] = round(result["bytes"] / 1e6 / result["seconds"], 1)
+    if "frames" in result and result.get("seconds"):
+        result["fps"] = round(result["frames"] / result["seconds"], 1)
+    return result
+
+def run_suite(args):
+    ffmpeg = args.ffmpeg or shutil.which("ffmpeg")
+    if not ffmpeg:
+        sys.exit("ffmpeg not found on PATH (use --ffmpeg)")
+    filters = subprocess.run([ffmpeg, "-hide_banner", "-filters"], capture_output=True).stdout.decode(errors='ignore')
+    if not re.search(r'^\s*\S+\s+drawtext\s', filters, re.M):
+        if ob.renderer() == "drawtext":
+            sys.exit(f"{ffmpeg} has no drawtext filter (built without libfreetype), so it can't burn the overlay. "
+                     f"Use an ffmpeg with drawtext, or set OVERLAY_RENDERER=ass to test the ass renderer only.")
+        print(f"NOTE: {ffmpeg} has no drawtext filter; the drawtext renderer and static text layer are not tested")
+    matrix = [(codec, size, seconds, placement)
+              for codec in (CLIP_CODECS[:1] if args.quick else CLIP_CODECS)
+              for size in (RESOLUTIONS[:1] if args.quick else RESOLUTIONS)
+              for seconds in (LENGTHS[:1] if args.quick else LENGTHS)
+              for placement in PLACEMENTS]
+    version = subprocess.run([ffmpeg, "-version"], capture_output=True).stdout.decode(errors='ignore').splitlines()
+    results = {"created": datetime.datetime.now().isoformat(timespec='seconds'), "host": platform.node(),
+               "platform": platform.platform(), "python": platform.python_version(),
+               "ffmpeg": version[0] if version else ffmpeg, "clips": []}
+    failures = []
+
+    with tempfile.TemporaryDirectory(prefix="overlay-bench-") as tmp:
+        workdir = Path(tmp)
+        clips = workdir / "clips"
+        clips.mkdir()
+        for n, (codec, size, seconds, placement) in enumerate(matrix, 1):
+            name = f"cam{n}-20251118{time.strftime('%H%M%S', time.gmtime(CLIP_START))}.mp4"
+            path = clips / name
+            stream, expected = make_clip(ffmpeg, path, size, seconds, placement, codec)
+            annexb = workdir / (name + ".h264")
+            annexb.write_bytes(stream)
+            print(f"{name}: {codec} {size}, {seconds}s, SEI {placement} ({path.stat().st_size / 1e6:.1f} MB)")
+
+            clip = {"name": name, "codec": codec, "resolution": size, "seconds": seconds, "placement": placement,
+                    "bytes": path.stat().st_size, "expected": expected}
+            for stage, target in (("find_sei", annexb), ("probe", path), ("native", path), ("process", path)):
+                result = throughput(measure(stage, target, ffmpeg, workdir, codec))
+                clip[stage] = result
+                if "error" in result:
+                    failures.append(f"{name} {stage}: {result['error']}")
+                elif stage == "process":
+                    if result.get("status") != "success":
+                        failures.append(f"{name} process: {result.get('status')}")
+                elif stage != "native" and result.get("found") != expected:
+                    # The native reader only looks at the first few samples, so "late" clips may miss
+                    failures.append(f"{name} {stage}: found {result.get('found')}, expected {expected}")
+                rate = (f"{result['mb_s']:9.1f} MB/s" if "mb_s" in result else
+                        f"{result['fps']:9.1f} fps " if "fps" in result else " " * 14)
+                print(f"  {stage:<9} {result.get('seconds', 0):7.2f}s {rate}  peak RSS {result.get('peak_rss_kb')} KiB")
+            annexb.unlink()
+            shutil.rmtree(clips / "with_overlay", ignore_errors=True)
+            results["clips"].append(clip)
+
+        batch = measure("main", clips, ffmpeg, workdir)
+        results["batch"] = batch
+        if "error" in batch:
+            failures.append(f"main: {batch['error']}")
+        print(f"main() over {len(matrix)} clips: {batch.get('seconds', 0):.2f}s, peak RSS {batch.get('peak_rss_kb')} KiB")
+
+        failures += check_unparsable_record(ffmpeg, workdir)
+        failures += check_segment_joins(ffmpeg, workdir, results)
+        failures += check_workers(ffmpeg, workdir, results)
+
+    results["failures"] = failures
+    Path(args.out).write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.out}")
+    if args.baseline:
+        compare_results(json.loads(Path(args.baseline).read_text()), results)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+def check_unparsable_record(ffmpeg, workdir):
+    """A Dividia record that doesn't parse (camera name too short) must not stop the mapped probe"""
+    path = workdir / "unparsable.h264"
+    path.write_bytes(dividia_sei_nal(CLIP_START, camera=b"Ab") + slice_nal(4000, True))
+    result = measure("mapped", path, ffmpeg, workdir)
+    path.unlink()
+    print(f"Unparsable record, mapped probe: {result.get('error') or 'no metadata, as expected'}")
+    if "error" in result:
+        return [f"unparsable record, mapped probe: {result['error']}"]
+    if result.get("found") is not None:
+        return [f"unparsable record, mapped probe: found {result['found']}"]
+    return []
+
+def check_segment_joins(ffmpeg, workdir, results):
+    """A segmented encode must have the source's frames and draw the same clock as a whole-clip encode.
+
+    The clock row of each output is compared by PSNR on the frames on
+    either side of every join, so a segment whose overlay starts from the
+    wrong time (or a seek that lands on the wrong keyframe) shows up as a
+    mismatch with the clip encoded in one piece.
+    """
+    folder = workdir / "segments"
+    folder.mkdir()
+    path = folder / f"segcam-20251118{time.strftime('%H%M%S', time.gmtime(CLIP_START))}.mp4"
+    make_clip(ffmpeg, path, RESOLUTIONS[0], SEGMENT_CHECK_SECONDS, "keyframes")
+    out = folder / "with_overlay" / (path.stem + "_overlay.mp4")
+    settings = {"OVERLAY_SEGMENT_MIN_DURATION": str(SEGMENT_CHECK_SECONDS)}
+    failures = []
+
+    whole = measure("process", path, ffmpeg, workdir, settings=dict(settings, OVERLAY_SEGMENTS="0"))
+    if whole.get("status") != "success":
+        return [f"segment joins, whole encode: {whole.get('error') or whole.get('status')}"]
+    reference = folder / "whole.mp4"
+    out.replace(reference)
+    # One encode slot per segment, so the clip is split as planned on any machine
+    segmented = measure("process", path, ffmpeg, workdir,
+                        settings=dict(settings, OVERLAY_SEGMENTS=str(SEGMENT_CHECK_COUNT),
+                                      OVERLAY_ENCODE_CONCURRENCY=str(SEGMENT_CHECK_COUNT)))
+    if segmented.get("status") != "success":
+        return [f"segment joins, segmented encode: {segmented.get('error') or segmented.get('status')}"]
+    if not segmented.get("segments") or len(segmented["segments"]) < 2:
+        return [f"segment joins: the {SEGMENT_CHECK_SECONDS}s clip wasn't split into segments"]
+
+    source_frames = ob.read_mp4_track(path).sample_count
+    output_frames = ob.read_mp4_track(out).sample_count
+    if output_frames != source_frames:
+        failures.append(f"segment joins: {output_frames} frames, source has {source_frames}")
+
+    joins = []
+    for _, frames in segmented["segments"][:-1]:
+        joins.append((joins[-1] if joins else 0) + frames)
+    frames_at_joins = [n for join in joins for n in range(join - JOIN_FRAMES, join + JOIN_FRAMES)]
+    # Blank rows would compare equal too, so the clock must first be shown to differ from the source
+    drawn = clock_row_psnr(ffmpeg, reference, path, joins)
+    if len(drawn) != len(frames_at_joins) or max(drawn) >= MIN_CLOCK_PSNR:
+        shutil.rmtree(folder)
+        return failures + ["segment joins: no clock drawn in the whole-clip encode's bottom row"]
+    scores = clock_row_psnr(ffmpeg, out, reference, joins)
+    worst = min(zip(scores, frames_at_joins), default=None)
+    if len(scores) != len(frames_at_joins):
+        failures.append(f"segment joins: compared {len(scores)} frames at the joins, expected {len(frames_at_joins)}")
+    elif worst[0] < MIN_CLOCK_PSNR:
+        failures.append(f"segment joins: clock differs from the whole-clip encode at frame {worst[1]} "
+                        f"(PSNR {worst[0]:.1f} dB)")
+    results["segment_joins"] = {"segments": segmented["segments"], "frames": output_frames,
+                                "min_clock_psnr": worst and worst[0]}
+    print(f"Segmented encode: {len(joins) + 1} segments, {output_frames}/{source_frames} frames, "
+          f"clock row PSNR at the joins >= {worst[0] if worst else '?'} dB")
+    shutil.rmtree(folder)
+    return failures
+
+def clock_row_psnr(ffmpeg, a, b, joins):
+    """PSNR between the clock rows of videos a and b on the JOIN_FRAMES frames either side of each join"""
+    select = "+".join(f"between(n,{join - JOIN_FRAMES},{join + JOIN_FRAMES - 1})" for join in joins)
+    clock_row = f"select='{select}',crop=iw/2:70:0:ih-70"  # Left half of the bottom text row
+    stats = subprocess.run([ffmpeg, "-v", "error", "-i", str(a), "-i", str(b), "-lavfi",
+                            f"[0:v]{clock_row}[a];[1:v]{clock_row}[b];[a][b]psnr=stats_file=-", "-f", "null", "-"],
+                           capture_output=True).stdout.decode(errors='ignore')
+    return [float(line.split("psnr_avg:")[1].split()[0]) for line in stats.splitlines() if "psnr_avg:" in line]
+
+def start_worker(folder, ffmpeg, workdir, worker_id):
+    """Start overlay_burner.py --worker on folder in its own directory, so it keeps a log of its own"""
+    home = workdir / worker_id
+    home.mkdir(exist_ok=True)
+    env = dict(os.environ, OVERLAY_INDEX="0", OVERLAY_FFMPEG=ffmpeg, OVERLAY_LOG_FORMAT="text",
+               OVERLAY_WORKER_ID=worker_id, OVERLAY_LEASE_SECONDS=str(WORKER_LEASE_SECONDS))
+    # A session of its own lets the takeover check kill the worker together with its ffmpeg
+    return subprocess.Popen([sys.executable, str(Path(ob.__file__).resolve()), str(folder), "--worker", "--headless"],
+                            cwd=home, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+
+def kill_worker(proc):
+    """Kill a worker and its ffmpeg at once, as a crashed machine would stop them"""
+    if hasattr(os, "killpg"):
+        os.killpg(proc.pid, signal.SIGKILL)
+    else:
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+    proc.wait()
+
+def worker_logs(workdir, worker_ids):
+    logs = {}
+    for worker_id in worker_ids:
+        try:
+            logs[worker_id] = (workdir / worker_id / "overlay_log.txt").read_text(encoding="utf-8", errors="ignore")
+        except OSError:
+            logs[worker_id] = ""
+    return logs
+
+def lease_leftovers(folder):
+    """Lease, stale-lease, partial and failure files left in with_overlay/"""
+    outputs = folder / "with_overlay"
+    return sorted(p.name for p in outputs.iterdir()
+                  if p.name.endswith((".lease", ".part", ".stale", ".failed"))) if outputs.exists() else []
+
+def check_workers(ffmpeg, workdir, results):
+    """Several --worker processes on one folder must burn every clip exactly once and clean up their leases.
+
+    Then a worker is killed mid-encode; another one must take its clip over
+    once the lease has gone OVERLAY_LEASE_SECONDS without being renewed.
+    Last, a worker is paused mid-encode instead: once its clip has been taken
+    over and it resumes, it must give the clip up rather than burn it again.
+    """
+    failures = []
+    shared = workdir / "shared"
+    shared.mkdir()
+    clip_time = time.strftime('%H%M%S', time.gmtime(CLIP_START))
+    for n in range(WORKER_CLIPS):
+        make_clip(ffmpeg, shared / f"cam{n + 1}-20251118{clip_time}.mp4", RESOLUTIONS[0], LENGTHS[0], "keyframes")
+    worker_ids = [f"worker{n + 1}" for n in range(WORKER_COUNT)]
+    start = time.perf_counter()
+    procs = [start_worker(shared, ffmpeg, workdir, worker_id) for worker_id in worker_ids]
+    for proc in procs:
+        try:
+            proc.wait(timeout=600)
+        except subprocess.TimeoutExpired:
+            kill_worker(proc)
+            failures.append(f"workers: a worker was still running after 600s")
+    elapsed = time.perf_counter() - start
+    logs = worker_logs(workdir, worker_ids)
+    burns = {worker_id: log.count("Created: ") for worker_id, log in logs.items()}
+    for clip in sorted(shared.glob("*.mp4")):
+        name = clip.stem + "_overlay.mp4"
+        burned = [worker_id for worker_id, log in logs.items() if f"Created: {name} " in log]
+        if len(burned) != 1:
+            failures.append(f"workers: {clip.name} was burned {len(burned)} times ({', '.join(burned) or 'never'})")
+    if lease_leftovers(shared):
+        failures.append(f"workers: left behind {', '.join(lease_leftovers(shared))}")
+    print(f"{WORKER_COUNT} workers over {WORKER_CLIPS} clips: {elapsed:.2f}s, burned " +
+          ", ".join(f"{worker_id} {count}" for worker_id, count in burns.items()))
+
+    # Takeover: kill a worker once its encode has started, then let another one finish the batch
+    stranded = workdir / "stranded"
+    stranded.mkdir()
+    clip = stranded / f"cam1-20251118{clip_time}.mp4"
+    make_clip(ffmpeg, clip, RESOLUTIONS[0], LENGTHS[-1], "keyframes")
+    part = stranded / "with_overlay" / f"{clip.stem}_overlay.mp4.crashed.part"
+    proc = start_worker(stranded, ffmpeg, workdir, "crashed")
+    deadline = time.monotonic() + 60
+    while proc.poll() is None and time.monotonic() < deadline and not (part.exists() and part.stat().st_size):
+        time.sleep(0.05)
+    encoding = proc.poll() is None and part.exists()
+    kill_worker(proc)
+    if not encoding:
+        failures.append("workers: the worker to be killed never started encoding")
+    else:
+        killed = time.perf_counter()
+        proc = start_worker(stranded, ffmpeg, workdir, "rescuer")
+        try:
+            proc.wait(timeout=600)
+        except subprocess.TimeoutExpired:
+            kill_worker(proc)
+        waited = time.perf_counter() - killed
+        log = worker_logs(workdir, ["rescuer"])["rescuer"]
+        if "taking the file over" not in log or f"Created: {clip.stem}_overlay.mp4 " not in log:
+            failures.append("workers: the killed worker's clip was not taken over")
+        elif waited < WORKER_LEASE_SECONDS:
+            failures.append(f"workers: the clip was taken over after {waited:.1f}s, "
+                            f"before its lease expired ({WORKER_LEASE_SECONDS}s)")
+        if lease_leftovers(stranded):
+            failures.append(f"workers: left behind after the takeover: {', '.join(lease_leftovers(stranded))}")
+        print(f"Killed worker's clip taken over and burned {waited:.1f}s after the kill "
+              f"(lease expiry {WORKER_LEASE_SECONDS}s)")
+        results["workers"] = {"workers": WORKER_COUNT, "clips": WORKER_CLIPS, "seconds": round(elapsed, 2),
+                              "burned": burns, "takeover_seconds": round(waited, 2)}
+    shutil.rmtree(shared)
+    shutil.rmtree(stranded)
+    if hasattr(signal, "SIGSTOP"):
+        failures += check_paused_worker(ffmpeg, workdir, clip_time)
+    return failures
+
+def check_paused_worker(ffmpeg, workdir, clip_time):
+    """A worker stalled past its lease must not renew or commit once another worker has taken over"""
+    failures = []
+    paused = workdir / "paused"
+    paused.mkdir()
+    clip = paused / f"cam1-20251118{clip_time}.mp4"
+    make_clip(ffmpeg, clip, RESOLUTIONS[0], LENGTHS[-1], "keyframes")
+    part = paused / "with_overlay" / f"{clip.stem}_overlay.mp4.stalled.part"
+    proc = start_worker(paused, ffmpeg, workdir, "stalled")
+    deadline = time.monotonic() + 60
+    while proc.poll() is None and time.monotonic() < deadline and not (part.exists() and part.stat().st_size):
+        time.sleep(0.05)
+    if proc.poll() is not None or not part.exists():
+        kill_worker(proc)
+        shutil.rmtree(paused)
+        return ["workers: the worker to be paused never started encoding"]
+    os.killpg(proc.pid, signal.SIGSTOP)
+    rescuer = start_worker(paused, ffmpeg, workdir, "taker")
+    try:
+        rescuer.wait(timeout=600)
+    except subprocess.TimeoutExpired:
+        kill_worker(rescuer)
+    os.killpg(proc.pid, signal.SIGCONT)
+    try:
+        proc.wait(timeout=600)
+    except subprocess.TimeoutExpired:
+        kill_worker(proc)
+    logs = worker_logs(workdir, ["stalled", "taker"])
+    name = f"{clip.stem}_overlay.mp4"
+    burned = [worker_id for worker_id, log in logs.items() if f"Created: {name} " in log]
+    if burned != ["taker"]:
+        failures.append(f"workers: the paused worker's clip was burned by {', '.join(burned) or 'nobody'}")
+    if "discarding this encode" not in logs["stalled"]:
+        failures.append("workers: the paused worker didn't notice its lease was taken over")
+    if lease_leftovers(paused):
+        failures.append(f"workers: left behind after the pause: {', '.join(lease_leftovers(paused))}")
+    print("Paused worker gave its clip up to the worker that took it over")
+    shutil.rmtree(paused)
+    return failures
+
+def compare_results(old, new):
+    """Print each metric's change from an earlier results file, matched by clip parameters"""
+    print(f"\nChange since {old.get('created')} ({old.get('ffmpeg')}):")
+    key = lambda clip: (clip.get("codec", "h264"), clip["resolution"], clip["seconds"], clip["placement"])
+    previous = {key(clip): clip for clip in old.get("clips", [])}
+    for clip in new["clips"]:
+        before = previous.get(key(clip))
+        if before is None:
+            continue
+        changes = []
+        for stage, metric in (("find_sei", "mb_s"), ("probe", "mb_s"), ("process", "fps")):
+            a, b = before.get(stage, {}).get(metric), clip[stage].get(metric)
+            if a and b:
+                changes.append(f"{stage} {(b - a) / a:+.0%}")
+        print(f"  {clip['codec']:<4} {clip['resolution']:>9} {clip['seconds']:>3}s {clip['placement']:<9} " + ", ".join(changes))
+    a, b = old.get("batch", {}).get("seconds"), new["batch"].get("seconds")
+    if a and b:
+        print(f"  main() batch time {(b - a) / a:+.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sei = sub.add_parser("sei-scan", help="compare find_sei() with SeiScanner on a synthetic stream")
+    sei.add_argument("--size-mb", type=int, default=1024, help="stream size in MiB (default 1024)")
+    sei.set_defaults(func=run_sei_scan)
+    suite = sub.add_parser("suite", help="generate test clips and measure probe, process() and main()")
+    suite.add_argument("--quick", action="store_true", help="one resolution and length only")
+    suite.add_argument("--ffmpeg", help="ffmpeg to use (default: the one on PATH)")
+    suite.add_argument("--out", default="benchmark_results.json", help="results file (default benchmark_results.json)")
+    suite.add_argument("--baseline", help="earlier results file to compare against")
+    suite.set_defaults(func=run_suite)
+    stage = sub.add_parser("_stage")  # Internal: one measurement, run in a child process by suite
+    stage.add_argument("stage", choices=("find_sei", "probe", "mapped", "native", "process", "main"))
+    stage.add_argument("path")
+    stage.add_argument("--result", required=True)
+    stage.add_argument("--codec", choices=tuple(ob.CODECS), default="h264")
+    stage.set_defaults(func=run_stage)
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
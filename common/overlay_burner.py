@@ -1,17 +1,31 @@
 import sys
+import argparse
+import json
 import subprocess
 import struct
 import time
 import os
+import re
+import mmap
+import math
+import bisect
+import tempfile
+import shutil
+import sqlite3
+import hashlib
 import platform
+import threading
+import queue
+import atexit
+import select
+import signal
+import ctypes
+import ctypes.util
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
-# Platform-specific imports
-if platform.system() == 'Windows':
-    import tkinter as tk
-    from tkinter import ttk
-    import threading
-
 # Determine ffmpeg path based on platform and execution mode
 if getattr(sys, 'frozen', False):
     # Running as PyInstaller bundle
@@ -31,15 +45,326 @@ else:
         FFMPEG_PATH = str(Path(__file__).parent.parent / "windows" / "ffmpeg.exe")
     else:
         FFMPEG_PATH = str(Path(__file__).parent.parent / "mac" / "ffmpeg")
+# OVERLAY_FFMPEG names another ffmpeg (a service importing the module, a
+# system install); without it, a checkout with no bundled binary uses the
+# one on PATH
+if os.environ.get("OVERLAY_FFMPEG"):
+    FFMPEG_PATH = os.environ["OVERLAY_FFMPEG"]
+elif not Path(FFMPEG_PATH).exists():
+    FFMPEG_PATH = shutil.which("ffmpeg") or FFMPEG_PATH
 
 LOG_FILE = Path(sys.executable).with_name("overlay_log.txt") if getattr(sys, 'frozen', False) else Path("overlay_log.txt")
 
-# Windows progress window class
+def _env_number(name, default, cast=int):
+    """Read a numeric setting from the environment, falling back to default"""
+    try:
+        return cast(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# SEI probe settings. The probe stops reading the extractor pipe as soon as the
+# first Dividia metadata record is found (OVERLAY_PROBE_EARLY_EXIT=0 reads to EOF
+# like older versions). If nothing turns up within the byte or time budget the
+# probe gives up and the defaults are used. A budget of 0 disables that limit.
+PROBE_EARLY_EXIT = _env_number("OVERLAY_PROBE_EARLY_EXIT", 1) != 0
+PROBE_MAX_BYTES = _env_number("OVERLAY_PROBE_MAX_BYTES", 64 * 1048576)
+PROBE_TIMEOUT = _env_number("OVERLAY_PROBE_TIMEOUT", 30.0, float)
+
+# Native MP4 probe: read the SEI straight out of the first few samples of the
+# video track instead of spawning ffmpeg. Files the parser can't handle (or
+# with no metadata in those samples) fall back to the ffmpeg probe.
+NATIVE_PROBE = _env_number("OVERLAY_NATIVE_PROBE", 1) != 0
+NATIVE_PROBE_SAMPLES = _env_number("OVERLAY_NATIVE_PROBE_SAMPLES", 8)
+
+# Source codecs: the bitstream filter and raw format that give the probe an
+# Annex B stream, and the NAL header of the SEI units carrying the metadata -
+# H.264 type 6 (one byte), HEVC prefix SEI type 39 (two bytes, layer 0).
+CODECS = {
+    "h264": {"bsf": "h264_mp4toannexb", "format": "h264", "sei_header": b'\x06'},
+    "hevc": {"bsf": "hevc_mp4toannexb", "format": "hevc", "sei_header": b'\x4e\x01'},
+}
+
+# Mapped probe: when the sample table probe finds nothing, files on a local disk
+# are scanned in place through mmap (within PROBE_MAX_BYTES) rather than piped
+# through ffmpeg. Pages behind the scan are released every MMAP_RELEASE_BYTES
+# so memory stays flat however large the file or however many probes run.
+MMAP_PROBE = _env_number("OVERLAY_MMAP_PROBE", 1) != 0
+MMAP_RELEASE_BYTES = 64 * 1048576
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smbfs", "smb3", "afpfs", "webdav", "fuse.sshfs"}
+
+# Single-pass mode: when the metadata isn't in the MP4 index, demux the file once
+# and scan the copied stream on its way into the encoder instead of running a
+# separate probe (halves disk reads for clips on network shares).
+SINGLE_PASS = _env_number("OVERLAY_SINGLE_PASS", 0) != 0
+
+# Stream mode (--stream): a clip piped in on stdin or through a named pipe is
+# burned the same single-pass way and written to stdout as fragmented MP4, so
+# nothing touches the disk and memory stays bounded by the probe byte budget.
+# The codec is read from the first STREAM_HEAD_BYTES: MP4 input needs its moov
+# box up front (fragmented or faststart), otherwise Annex B is assumed.
+STREAM_HEAD_BYTES = 16 * 1048576
+STREAM_MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+
+# Clock correction: read the SEI record of every keyframe (not just the first)
+# so the overlay follows the recorder's clock across dropped frames, gaps and
+# midnight. Only discontinuities are stored, up to TIMELINE_MAX_SEGMENTS.
+USE_TIMELINE = _env_number("OVERLAY_TIMELINE", 1) != 0
+TIMELINE_MAX_SEGMENTS = 4096
+# The drawtext clock repeats one expression term per segment for hours,
+# minutes and seconds; clips with more segments than this are drawn with the
+# ass renderer so the ffmpeg command line stays under Windows' 32K limit
+DRAWTEXT_MAX_SEGMENTS = 200
+
+# Encoder profiles. "fast" is the original ultrafast/CRF 23 encode; "size" spends
+# more CPU for smaller files; "match" targets the source's own video bitrate so
+# outputs stay about the size of the recordings. --calibrate measures each one
+# on a sample from the batch and saves the best choice to CALIBRATION_FILE.
+ENCODER_PROFILES = {
+    "fast": ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23"],
+    "size": ["-c:v", "libx264", "-preset", "faster", "-crf", "26"],
+    "match": ["-c:v", "libx264", "-preset", "veryfast"],  # Bitrate added per file
+}
+# HEVC sources are encoded back to HEVC with the matching x265 profile, so the
+# outputs stay about as small as the recordings (OVERLAY_HEVC_OUTPUT=0 encodes
+# them to H.264 like everything else). hvc1 tagging lets QuickTime play them.
+HEVC_ENCODER_PROFILES = {
+    "fast": ["-c:v", "libx265", "-preset", "ultrafast", "-crf", "28", "-tag:v", "hvc1"],
+    "size": ["-c:v", "libx265", "-preset", "faster", "-crf", "30", "-tag:v", "hvc1"],
+    "match": ["-c:v", "libx265", "-preset", "veryfast", "-tag:v", "hvc1"],
+}
+HEVC_OUTPUT = _env_number("OVERLAY_HEVC_OUTPUT", 1) != 0
+AUDIO_ARGS = ["-c:a", "copy", "-strict", "-2"]
+CALIBRATION_FILE = LOG_FILE.with_name("overlay_calibration.json")
+ENCODER_PROFILE = os.environ.get("OVERLAY_ENCODER_PROFILE", "")  # Empty = calibrated or "fast"
+ENCODER_THREADS = _env_number("OVERLAY_ENCODER_THREADS", 0)      # 0 = let x264 decide
+ENCODER_SLICES = _env_number("OVERLAY_ENCODER_SLICES", 0)        # 0 = x264 default
+CALIBRATE_SECONDS = _env_number("OVERLAY_CALIBRATE_SECONDS", 10.0, float)
+TARGET_FPS = _env_number("OVERLAY_TARGET_FPS", 120.0, float)
+
+# Segmented encoding: a long clip is cut at keyframes into SEGMENTS pieces that
+# are encoded in parallel, each with the clock offset for its start, then
+# joined losslessly with the concat demuxer. One ultrafast x264 process stops
+# scaling after a few threads, so this spreads a single 4-hour recording over
+# the whole machine. Each segment takes an encode slot of its own, so a clip
+# gets only as many segments as there are free slots. The joined file is
+# checked (frame count and timestamps at every join) and encoded in one piece
+# if the check fails; the benchmark suite compares the clock at the joins.
+SEGMENTS = _env_number("OVERLAY_SEGMENTS", 0)                     # 0/1 = encode whole
+SEGMENT_MIN_DURATION = _env_number("OVERLAY_SEGMENT_MIN_DURATION", 600.0, float)
+
+# Render modes. "full" draws the overlay on the whole frame. "band" draws it on
+# a crop of the bottom BAND_HEIGHT rows and composes that strip back, and tells
+# x264 to spend more bits there (a lower quantizer for the band, ROI); the
+# picture above it keeps the profile's CRF, so evidence footage is encoded no
+# coarser than in full mode. H.264 can't stream-copy part of a frame, and the
+# clock changes every second so no GOP is left untouched - every frame is
+# still re-encoded, just with less filtering. Band mode only takes effect once
+# --compare-modes has measured it faster than full on this machine, with the
+# picture above the band no more than BAND_MAX_PSNR_LOSS dB worse (saved to
+# RENDER_MODES_FILE); until then OVERLAY_RENDER_MODE=band encodes in full.
+# OVERLAY_QUALITY_CHECK (or --compare-modes) reports PSNR/SSIM of the picture
+# above the band against the source so the trade-off can be measured.
+RENDER_MODES = ("full", "band")
+RENDER_MODE = os.environ.get("OVERLAY_RENDER_MODE", "full")
+RENDER_MODES_FILE = LOG_FILE.with_name("overlay_render_modes.json")
+BAND_HEIGHT = _env_number("OVERLAY_BAND_HEIGHT", 200)            # Covers the three text rows at main_h-180..main_h
+BAND_QOFFSET = -0.4                                               # ROI quantizer offset for the band (-1..1)
+BAND_MAX_PSNR_LOSS = 0.5
+QUALITY_CHECK = _env_number("OVERLAY_QUALITY_CHECK", 0) != 0
+
+# Overlay renderers. "drawtext" evaluates the clock expression on every frame.
+# "ass" burns a generated subtitle file with one clock cue per second. "soft"
+# muxes that file as a subtitle track instead - a pure remux with no encode,
+# for customers who accept the player drawing the overlay.
+RENDERERS = ("drawtext", "ass", "soft")
+RENDERER = os.environ.get("OVERLAY_RENDERER", "drawtext")
+
+# Static text layer: with the drawtext renderer the camera name and date never
+# change, so they are drawn once per (camera, date, frame width) into a
+# transparent PNG and laid over each frame with the overlay filter; only the
+# clock is left to drawtext. The font is looked up once per run.
+STATIC_TEXT_LAYER = _env_number("OVERLAY_STATIC_TEXT_LAYER", 1) != 0
+TEXT_STYLE = "fontsize=48:fontcolor=white:borderw=4:bordercolor=black"
+STATIC_LAYER_TOP = 190    # Layer rows span main_h-190..main_h-50, with room for the text border
+STATIC_LAYER_HEIGHT = 140
+
+# Mosaic export (--mosaic): the selected clips are grouped by camera, lined up
+# by the recorder clock in their SEI and tiled with xstack into one video
+# MOSAIC_WIDTH pixels across, each tile with its own overlay. Every clip is
+# decoded once and the composite is encoded once, instead of burning each
+# clip and encoding again to tile them. Time before, between and after a
+# camera's clips is black.
+MOSAIC_WIDTH = _env_number("OVERLAY_MOSAIC_WIDTH", 1920)
+
+# Persistent metadata index: per-source-file probe results and output status,
+# keyed by path and invalidated when the source's size or mtime changes.
+USE_INDEX = _env_number("OVERLAY_INDEX", 1) != 0
+INDEX_FILE = Path(os.environ.get("OVERLAY_INDEX_FILE") or LOG_FILE.with_name("overlay_index.sqlite"))
+
+# Batch concurrency. Several files are in flight at once; probes are I/O bound
+# and can fan out, while each libx264 encode already uses several threads, so
+# the number of simultaneous encodes is sized to a fraction of the core count.
+CPU_COUNT = os.cpu_count() or 1
+ENCODE_CONCURRENCY = max(1, _env_number("OVERLAY_ENCODE_CONCURRENCY", max(1, CPU_COUNT // 4)))
+PROBE_CONCURRENCY = max(1, _env_number("OVERLAY_PROBE_CONCURRENCY", 8))
+BATCH_WORKERS = max(1, _env_number("OVERLAY_WORKERS", ENCODE_CONCURRENCY * 2))
+DISCOVERY_THREADS = max(1, _env_number("OVERLAY_DISCOVERY_THREADS", 8))  # Directories listed at once
+
+# Watch mode (--watch). New videos are noticed through inotify on Linux, or by
+# rescanning the folders every WATCH_POLL_INTERVAL seconds elsewhere, and are
+# queued once their size has not changed for WATCH_SETTLE seconds and the MP4
+# is complete. Status goes to WATCH_STATUS_FILE and, with OVERLAY_WATCH_PORT,
+# to http://127.0.0.1:<port>/.
+WATCH_POLL_INTERVAL = _env_number("OVERLAY_WATCH_POLL_INTERVAL", 10.0, float)
+WATCH_SETTLE = _env_number("OVERLAY_WATCH_SETTLE", 5.0, float)
+WATCH_STATUS_FILE = Path(os.environ.get("OVERLAY_WATCH_STATUS_FILE") or LOG_FILE.with_name("overlay_watch_status.json"))
+WATCH_STATUS_PORT = _env_number("OVERLAY_WATCH_PORT", 0)
+WATCH_STATUS_INTERVAL = 2.0  # Seconds between status file updates
+
+# Sharing the host with live recording services. OVERLAY_NICE lowers the CPU
+# priority of the tool and every ffmpeg it starts (1-19; on Windows below
+# normal, or idle from 15), OVERLAY_IO_PRIORITY their disk priority (low or
+# idle; Linux and macOS). With OVERLAY_MAX_CPU the number of encodes running
+# at once is adapted to keep whole-system CPU use under that percentage:
+# every SCHED_INTERVAL seconds one slot is taken away while above it, and
+# given back (up to ENCODE_CONCURRENCY) while SCHED_HEADROOM points below it.
+# OVERLAY_PROBE_READ_MBPS caps the combined read rate of the probes.
+# OVERLAY_ENCODER_THREADS caps the threads of each encode.
+NICE = _env_number("OVERLAY_NICE", 0)
+IO_PRIORITY = os.environ.get("OVERLAY_IO_PRIORITY", "normal")
+MAX_CPU = _env_number("OVERLAY_MAX_CPU", 0.0, float)              # Percent of all cores, 0 = no limit
+SCHED_INTERVAL = 5.0
+SCHED_HEADROOM = 15.0
+PROBE_READ_MBPS = _env_number("OVERLAY_PROBE_READ_MBPS", 0.0, float)  # 0 = no limit
+
+# Several machines can share one batch. Started with --worker, an instance
+# claims a file by creating <output>.lease in the shared with_overlay/ folder
+# before probing it and renews the lease every LEASE_SECONDS / 4 while it
+# works; files leased by others are checked again later. A lease that doesn't
+# change for LEASE_SECONDS (on the observing machine's clock, so clock skew
+# between machines doesn't matter) belonged to a worker that died, and the
+# next worker to check takes the file over. A worker whose lease was taken
+# over stops renewing it and throws its own encode away. A failed encode
+# leaves <output>.failed next to the lease, counting the attempts; once
+# WORKER_ATTEMPTS workers have failed on a file the others leave it alone
+# until the marker is deleted.
+WORKER_ID = os.environ.get("OVERLAY_WORKER_ID") or f"{platform.node()}-{os.getpid()}"
+LEASE_SECONDS = _env_number("OVERLAY_LEASE_SECONDS", 120.0, float)
+WORKER_ATTEMPTS = max(1, _env_number("OVERLAY_WORKER_ATTEMPTS", 2))
+
+class EncodeSlots:
+    """Semaphore for the encode stage whose size can change while the batch runs.
+
+    It also keeps, for each limit, how long it was in force and how many
+    source bytes were finished under it, for the run summary.
+    """
+
+    def __init__(self, limit):
+        self.limit = self.maximum = limit
+        self.active = 0
+        self.history = {}  # limit -> [seconds, bytes]
+        self._since = time.time()
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def acquire_free(self, count):
+        """Take up to count more slots without waiting; returns how many were taken"""
+        with self._cond:
+            taken = max(0, min(count, self.limit - self.active))
+            self.active += taken
+            return taken
+
+    def release(self, count):
+        with self._cond:
+            self.active -= count
+            self._cond.notify_all()
+
+    def resize(self, limit):
+        """Change the limit (clamped to 1..maximum); running encodes are not interrupted"""
+        limit = max(1, min(self.maximum, limit))
+        with self._cond:
+            if limit == self.limit:
+                return False
+            self._account()
+            self.limit = limit
+            self._cond.notify_all()
+        return True
+
+    def record(self, nbytes):
+        with self._cond:
+            self.history.setdefault(self.limit, [0.0, 0])[1] += nbytes
+
+    def throughput(self):
+        """[(limit, seconds, bytes)] for each limit used so far"""
+        with self._cond:
+            self._account()
+            return [(limit, seconds, nbytes) for limit, (seconds, nbytes) in sorted(self.history.items())]
+
+    def _account(self):
+        now = time.time()
+        self.history.setdefault(self.limit, [0.0, 0])[0] += now - self._since
+        self._since = now
+
+class ReadLimiter:
+    """Shared read-rate cap: after reading n bytes a caller sleeps until the
+    total read stays within rate bytes/s on average."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next = max(now, self._next) + nbytes / self.rate
+            delay = self._next - now
+        time.sleep(delay)
+
+_probe_slots = threading.BoundedSemaphore(PROBE_CONCURRENCY)
+_encode_slots = EncodeSlots(ENCODE_CONCURRENCY)
+_probe_reads = ReadLimiter(PROBE_READ_MBPS * 1e6)
+progress_lock = threading.Lock()  # Guards progress_data updates from worker threads
+_active_procs = set()             # ffmpeg processes to terminate if the batch is cancelled
+_log_context = threading.local()  # Per-worker file name prefixed to log lines
+_log_lock = threading.Lock()
+
+# Log file writer. log() hands lines to a background thread that appends them
+# in batches and rotates the file once it passes LOG_MAX_BYTES, keeping
+# LOG_BACKUPS old copies. OVERLAY_LOG_FORMAT=jsonl writes JSON objects to
+# overlay_log.jsonl instead, including a "file_done" record per video with
+# probe/encode timings, so logs from several machines can be aggregated.
+LOG_FORMAT = os.environ.get("OVERLAY_LOG_FORMAT", "text")
+LOG_MAX_BYTES = _env_number("OVERLAY_LOG_MAX_BYTES", 10 * 1048576)
+LOG_BACKUPS = _env_number("OVERLAY_LOG_BACKUPS", 3)
+LOG_QUEUE_SIZE = 10000
+LOG_FLUSH_INTERVAL = 0.5  # Seconds the writer waits to batch more lines
+HOST_NAME = platform.node()
+_log_writer = None
+_log_to_stderr = False  # Stream mode: stdout carries the video
+_headless = False       # --headless: no progress window, Terminal or dialogs
+
+# Windows progress window class. tkinter is imported when the first window is
+# opened, so importing this module as a library stays free of GUI work.
 class ProgressWindow:
     def __init__(self, total_files=0):
+        global tk, ttk
+        import tkinter as tk
+        from tkinter import ttk
         self.total_files = total_files
         self.should_stop = False
-        self.processing_times = []
         self.root = tk.Tk()
         self.root.title("Dividia Overlay Burner")
         self.root.geometry("500x350")
@@ -106,10 +431,8 @@ class ProgressWindow:
         self.root.update()
     
     def close_during_processing(self):
-        """Handle window close during processing - terminate immediately"""
+        """Handle window close during processing - main() stops the batch and exits"""
         self.should_stop = True
-        import sys
-        sys.exit(0)
     
     def start_processing(self, total_files):
         """Switch from preparing to processing mode"""
@@ -119,31 +442,24 @@ class ProgressWindow:
         self.progress_var.set(0)
         self.root.update()
         
-    def update(self, current_idx, current_file, success, skipped, failed, elapsed_time=None):
+    def update(self, current_idx, current_file, success, skipped, failed, est_time=None, total_files=None, searching=False):
+        if total_files is not None:
+            self.total_files = total_files  # Grows while files are still being found
         completed = success + skipped + failed
         pct = int(completed / self.total_files * 100) if self.total_files > 0 else 0
         
         self.file_label.config(text=current_file)
         self.progress_var.set(pct)
-        self.status_label.config(text=f"{completed} / {self.total_files} ({pct}%)")
+        found = f"{self.total_files}+ (searching...)" if searching else f"{self.total_files}"
+        self.status_label.config(text=f"{completed} / {found} ({pct}%)")
         self.stats_label.config(text=f"✓ {success}  ⊘ {skipped}  ✗ {failed}")
         
-        # Update time estimate if provided
-        if elapsed_time is not None and len(self.processing_times) > 0:
-            avg_time = sum(self.processing_times) / len(self.processing_times)
-            remaining_files = self.total_files - completed
-            if remaining_files > 0:
-                est_seconds = avg_time * remaining_files
-                est_mins = int(est_seconds / 60)
-                est_secs = int(est_seconds % 60)
-                self.time_label.config(text=f"Estimated time remaining: {est_mins}m {est_secs}s")
+        # Update time estimate if provided (computed by main() from batch throughput)
+        if est_time:
+            self.time_label.config(text=f"Estimated time remaining: {est_time}")
         
         self.root.update()
     
-    def add_processing_time(self, elapsed):
-        """Track processing time for estimates"""
-        self.processing_times.append(elapsed)
-    
     def show_complete(self, success, skipped, failed, total_time=None):
         """Show completion status and Close button"""
         self.file_label.config(text="Processing Complete!")
@@ -173,17 +489,98 @@ class ProgressWindow:
         self.root.quit()
         self.root.destroy()
 
-def log(msg):
-    line = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}"
-    try:
-        print(line)
-    except UnicodeEncodeError:
-        # Windows console can't handle some Unicode chars, print ASCII version
-        print(line.encode('ascii', 'replace').decode('ascii'))
-    try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
-    except: pass
+class LogWriter:
+    """Appends log lines to a file from a background thread.
+
+    Lines queue up while the writer is busy and are written with a single
+    open/append per batch, which matters on synced folders (OneDrive) where
+    every open is slow. The queue is bounded: if the disk stalls, callers
+    wait instead of memory growing.
+    """
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, line):
+        self._queue.put(line)
+
+    def close(self):
+        """Write everything still queued and stop the thread"""
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + LOG_FLUSH_INTERVAL
+            while batch[-1] is not None and len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            done = batch[-1] is None
+            if done:
+                batch.pop()
+            if batch:
+                self._write(batch)
+            if done:
+                return
+
+    def _write(self, lines):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                size = f.tell()
+            if self.max_bytes > 0 and size > self.max_bytes:
+                self._rotate()
+        except OSError:
+            pass
+
+    def _rotate(self):
+        """overlay_log.txt -> overlay_log.txt.1 -> .2 ..., dropping the oldest"""
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+def _close_log():
+    if _log_writer is not None:
+        _log_writer.close()
+
+def log(msg, **fields):
+    """Print a line and queue it for the log file.
+
+    fields are structured values (timings, counts) that are only kept in the
+    JSON-lines log; the text log has just the message.
+    """
+    global _log_writer
+    context = getattr(_log_context, 'name', None)
+    line = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] " + (f"[{context}] {msg}" if context else msg)
+    if LOG_FORMAT == "jsonl":
+        record = json.dumps({"time": time.strftime('%Y-%m-%dT%H:%M:%S'), "host": HOST_NAME,
+                             "file": context, "msg": msg, **fields})
+    else:
+        record = line
+    with _log_lock:  # Keep lines from worker threads from interleaving
+        console = sys.stderr if _log_to_stderr else sys.stdout
+        try:
+            print(line, file=console)
+        except UnicodeEncodeError:
+            # Windows console can't handle some Unicode chars, print ASCII version
+            print(line.encode('ascii', 'replace').decode('ascii'), file=console)
+        if _log_writer is None:
+            _log_writer = LogWriter(LOG_FILE.with_suffix(".jsonl") if LOG_FORMAT == "jsonl" else LOG_FILE)
+            atexit.register(_close_log)
+        _log_writer.write(record)
 
 def user_pause(title, msg):
     log(f"{title}: {msg}")
@@ -193,14 +590,69 @@ def user_pause(title, msg):
         # Running from Automator - no interactive terminal
         pass
 
-def find_sei(data, debug=False):
+def parse_dividia_sei(payload, debug=False):
+    """Decode a Dividia user-data SEI payload into (camera_name, HH:MM:SS).
+
+    Returns (None, None) if the payload is not a Dividia metadata record.
+    """
+    # Check for the pattern: 0xaa 0xff repeated 8 times, then 0xaa 0xaa 0xab 0xb2
+    if (len(payload) > 34 and 
+        payload[0:16] == b'\xaa\xff' * 8 and 
+        payload[16:18] == b'\xaa\xaa' and
+        payload[18] == 0xab and
+        payload[19] == 0xb2):
+        
+        # Structure: [header] [0xb2] [0x02 0x00] [0xc8 0x00] [timestamp_2bytes] [camera_name...]
+        # Camera name starts at byte 27
+        # Timestamp is 2 bytes at offset 24-25 (seconds since midnight)
+        
+        try:
+            # Extract camera name (starts at byte 27)
+            name_offset = 27
+            name_bytes = payload[name_offset:name_offset + 32]  # Read up to 32 bytes
+            # Decode and clean: remove null bytes, non-printable chars, and strip
+            name = name_bytes.split(b'\x00')[0].decode('utf-8', errors='ignore').strip()
+            # Remove any non-printable characters
+            name = ''.join(char for char in name if char.isprintable())
+            # Remove leading 'i' if present (artifact from encoding)
+            if name.startswith('i'):
+                name = name[1:]
+            
+            # Extract timestamp (2 bytes little-endian at offset 24)
+            ts_offset = 24
+            seconds_today = struct.unpack_from('<H', payload, ts_offset)[0]
+            
+            if debug:
+                log(f"  [OK] Parsing: name='{name}', seconds_today={seconds_today}")
+            
+            # Validate: name should have printable chars
+            if name and len(name) > 2:
+                # Convert seconds since midnight to readable time
+                hours = seconds_today // 3600
+                minutes = (seconds_today % 3600) // 60
+                seconds = seconds_today % 60
+                
+                # Use the video file's date + this time
+                # For now, we'll format it as HH:MM:SS
+                timestamp_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+                
+                if debug:
+                    log(f"  [SUCCESS] cam='{name}', time={timestamp_str}")
+                return name, timestamp_str
+        except Exception as e:
+            if debug:
+                log(f"  Parse error: {e}")
+    return None, None
+
+def find_sei(data, debug=False, codec="h264"):
     pos = 0
     sei_found = 0
+    pattern = b'\x00\x00\x00\x01' + CODECS[codec]["sei_header"] + b'\x05'
     while True:
-        s = data.find(b'\x00\x00\x00\x01\x06\x05', pos)
+        s = data.find(pattern, pos)
         if s == -1: break
         sei_found += 1
-        off = s + 6
+        off = s + len(pattern)
         size = 0
         while off < len(data) and data[off] == 0xFF:
             size += 255
@@ -213,243 +665,2967 @@ def find_sei(data, debug=False):
         if debug and sei_found <= 3:
             log(f"  SEI #{sei_found}: size={size}, first 40 bytes: {payload[:40].hex()}")
             # Add detailed check
-            log(f"    Check pattern: payload[0:16]=={b'\\xaa\\xff'*8}: {payload[0:16] == b'\\xaa\\xff'*8}")
-            log(f"    Check pattern: payload[16:18]=={b'\\xaa\\xaa'}: {payload[16:18] == b'\\xaa\\xaa'}")
+            marker, header = b'\xaa\xff' * 8, b'\xaa\xaa'
+            log(f"    Check pattern: payload[0:16]=={marker}: {payload[0:16] == marker}")
+            log(f"    Check pattern: payload[16:18]=={header}: {payload[16:18] == header}")
             log(f"    Check pattern: payload[18]==0xab: {payload[18] == 0xab if len(payload) > 18 else 'too short'}")
             log(f"    Check pattern: payload[19]==0xb2: {payload[19] == 0xb2 if len(payload) > 19 else 'too short'}")
 
-        # Check for the pattern: 0xaa 0xff repeated 8 times, then 0xaa 0xaa 0xab 0xb2
-        if (len(payload) > 34 and 
-            payload[0:16] == b'\xaa\xff' * 8 and 
-            payload[16:18] == b'\xaa\xaa' and
-            payload[18] == 0xab and
-            payload[19] == 0xb2):
-            
-            # Structure: [header] [0xb2] [0x02 0x00] [0xc8 0x00] [timestamp_2bytes] [camera_name...]
-            # Camera name starts at byte 27
-            # Timestamp is 2 bytes at offset 24-25 (seconds since midnight)
-            
-            try:
-                # Extract camera name (starts at byte 27)
-                name_offset = 27
-                name_bytes = payload[name_offset:name_offset + 32]  # Read up to 32 bytes
-                # Decode and clean: remove null bytes, non-printable chars, and strip
-                name = name_bytes.split(b'\x00')[0].decode('utf-8', errors='ignore').strip()
-                # Remove any non-printable characters
-                name = ''.join(char for char in name if char.isprintable())
-                # Remove leading 'i' if present (artifact from encoding)
-                if name.startswith('i'):
-                    name = name[1:]
-                
-                # Extract timestamp (2 bytes little-endian at offset 24)
-                ts_offset = 24
-                seconds_today = struct.unpack_from('<H', payload, ts_offset)[0]
-                
-                if debug:
-                    log(f"  [OK] Parsing: name='{name}', seconds_today={seconds_today}")
-                
-                # Validate: name should have printable chars
-                if name and len(name) > 2:
-                    # Convert seconds since midnight to readable time
-                    hours = seconds_today // 3600
-                    minutes = (seconds_today % 3600) // 60
-                    seconds = seconds_today % 60
-                    
-                    # Use the video file's date + this time
-                    # For now, we'll format it as HH:MM:SS
-                    timestamp_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-                    
-                    if debug:
-                        log(f"  [SUCCESS] cam='{name}', time={timestamp_str}")
-                    return name, timestamp_str
-            except Exception as e:
-                if debug:
-                    log(f"  Parse error: {e}")
-                pass
-                    
+        name, timestamp_str = parse_dividia_sei(payload, debug=debug)
+        if name:
+            return name, timestamp_str
+
         pos = s + 1
     
     if debug:
         log(f"  Total SEI NAL units found: {sei_found}")
     return None, None
 
-def process(path, current_num=1, total_num=1, progress_data=None):
-    log(f"Processing: {path.name}")
-    
-    # Update progress data if provided
-    if progress_data is not None:
-        progress_data['current'] = current_num
-        progress_data['current_file'] = path.name
-    
-    # Determine output directory - always use same directory as source file
-    output_dir = path.parent / "with_overlay"
-    expected_output = output_dir / (path.stem + "_overlay.mp4")
-    
-    if expected_output.exists():
-        log(f"Skipping {path.name} - overlay already exists at {expected_output.relative_to(path.parent)}")
-        if progress_data is not None:
-            progress_data['skipped'] += 1
-            progress_data['skipped_files'].append(path.name)
-        return "skipped"
-    
-    log(f"Starting SEI extraction with debug logging...")
-    log(f"Using ffmpeg: {FFMPEG_PATH}")
-    
-    import time
-    start_time = time.time()
-    
-    # Windows: hide console window completely
-    startupinfo = None
+def _iter_boxes(buf, start, end):
+    """Yield (type, body_start, box_end) for each ISO-BMFF box in buf[start:end]"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos  # Box extends to the end of the file
+        if size < header or pos + size > end:
+            raise ValueError(f"truncated '{box_type.decode('latin-1')}' box at offset {pos}")
+        yield box_type, pos + header, pos + size
+        pos += size
+
+def _find_box(buf, start, end, *box_path):
+    """Descend through nested boxes by type, returning (body_start, box_end) or None"""
+    for wanted in box_path:
+        for box_type, body, box_end in _iter_boxes(buf, start, end):
+            if box_type == wanted:
+                start, end = body, box_end
+                break
+        else:
+            return None
+    return start, end
+
+class Mp4Track:
+    """Sample table of the first H.264 video track in an MP4 file"""
+
+    def __init__(self, buf):
+        moov = _find_box(buf, 0, len(buf), b'moov')
+        if moov is None:
+            raise ValueError("no moov box (fragmented or incomplete file)")
+        for box_type, body, box_end in _iter_boxes(buf, *moov):
+            if box_type != b'trak':
+                continue
+            hdlr = _find_box(buf, body, box_end, b'mdia', b'hdlr')
+            if hdlr is None or buf[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+                continue
+            stbl = _find_box(buf, body, box_end, b'mdia', b'minf', b'stbl')
+            if stbl is None:
+                raise ValueError("video track has no sample table")
+            mdhd = _find_box(buf, body, box_end, b'mdia', b'mdhd')
+            if mdhd is None:
+                raise ValueError("video track has no media header")
+            if buf[mdhd[0]] == 1:  # Version 1: 64-bit times
+                self.timescale, duration = struct.unpack_from('>IQ', buf, mdhd[0] + 20)
+            else:
+                self.timescale, duration = struct.unpack_from('>II', buf, mdhd[0] + 12)
+            self.duration = duration / self.timescale if self.timescale else 0.0  # Seconds
+            tkhd = _find_box(buf, body, box_end, b'tkhd')
+            # Presentation size, 16.16 fixed point at the end of the track header
+            self.width, self.height = (n >> 16 for n in struct.unpack_from('>II', buf, tkhd[1] - 8)) if tkhd else (0, 0)
+            self._read_sample_table(buf, *stbl)
+            return
+        raise ValueError("no video track")
+
+    def _read_sample_table(self, buf, start, end):
+        tables = {box_type: (body, box_end) for box_type, body, box_end in _iter_boxes(buf, start, end)}
+
+        # Sample description: avc1/avc3 entry whose avcC gives the NAL length size,
+        # or hvc1/hev1 with an hvcC
+        body, box_end = tables[b'stsd']
+        entry_type = buf[body + 12:body + 16]
+        if entry_type in (b'avc1', b'avc3'):
+            self.codec, config_type, length_pos = "h264", b'avcC', 4
+        elif entry_type in (b'hvc1', b'hev1'):
+            self.codec, config_type, length_pos = "hevc", b'hvcC', 21
+        else:
+            raise ValueError(f"unsupported codec '{entry_type.decode('latin-1')}'")
+        entry_end = body + 8 + struct.unpack_from('>I', buf, body + 8)[0]
+        config = _find_box(buf, body + 8 + 8 + 78, entry_end, config_type)
+        if config is None:
+            raise ValueError(f"missing {config_type.decode()} box")
+        self.nal_length_size = (buf[config[0] + length_pos] & 0x03) + 1
+
+        # Sample sizes (stsz), either one fixed size or a table
+        body, box_end = tables[b'stsz']
+        fixed_size, self.sample_count = struct.unpack_from('>II', buf, body + 4)
+        if fixed_size:
+            self.sample_sizes = [fixed_size] * self.sample_count
+        else:
+            self.sample_sizes = [n for (n,) in struct.iter_unpack('>I', buf[body + 12:body + 12 + 4 * self.sample_count])]
+
+        # Chunk offsets (stco or co64 for files over 4 GB)
+        if b'co64' in tables:
+            body, box_end = tables[b'co64']
+            fmt = '>Q'
+        else:
+            body, box_end = tables[b'stco']
+            fmt = '>I'
+        count = struct.unpack_from('>I', buf, body + 4)[0]
+        width = struct.calcsize(fmt)
+        self.chunk_offsets = [n for (n,) in struct.iter_unpack(fmt, buf[body + 8:body + 8 + width * count])]
+
+        # Sample-to-chunk runs (stsc): (first_chunk, samples_per_chunk)
+        body, box_end = tables[b'stsc']
+        count = struct.unpack_from('>I', buf, body + 4)[0]
+        self.chunk_runs = [(first, per_chunk) for first, per_chunk, _ in
+                           struct.iter_unpack('>III', buf[body + 8:body + 8 + 12 * count])]
+
+        # Decode time deltas (stts) and composition offsets (ctts): (sample_count, delta) runs
+        body, box_end = tables[b'stts']
+        count = struct.unpack_from('>I', buf, body + 4)[0]
+        self.time_runs = list(struct.iter_unpack('>II', buf[body + 8:body + 8 + 8 * count]))
+        self.ctts_runs = []
+        if b'ctts' in tables:
+            body, box_end = tables[b'ctts']
+            count = struct.unpack_from('>I', buf, body + 4)[0]
+            fmt = '>Ii' if buf[body] == 1 else '>II'  # Version 1 offsets are signed
+            self.ctts_runs = list(struct.iter_unpack(fmt, buf[body + 8:body + 8 + 8 * count]))
+
+        # Sync samples (stss), 1-based; absent means every sample is a keyframe
+        self.sync_samples = None
+        if b'stss' in tables:
+            body, box_end = tables[b'stss']
+            count = struct.unpack_from('>I', buf, body + 4)[0]
+            self.sync_samples = array('I', buf[body + 8:body + 8 + 4 * count])
+            if sys.byteorder == 'little':
+                self.sync_samples.byteswap()
+
+    def iter_samples(self):
+        """Yield (file_offset, size) for each sample in decode order"""
+        sample = 0
+        for run_idx, (first_chunk, per_chunk) in enumerate(self.chunk_runs):
+            last_chunk = self.chunk_runs[run_idx + 1][0] - 1 if run_idx + 1 < len(self.chunk_runs) else len(self.chunk_offsets)
+            for chunk in range(first_chunk, last_chunk + 1):
+                offset = self.chunk_offsets[chunk - 1]
+                for _ in range(per_chunk):
+                    if sample >= self.sample_count:
+                        return
+                    size = self.sample_sizes[sample]
+                    yield offset, size
+                    offset += size
+                    sample += 1
+
+    def iter_sample_times(self):
+        """Yield each sample's presentation time in seconds, in decode order, relative to the first sample"""
+        ctts = iter(self.ctts_runs)
+        ctts_left = ctts_offset = 0
+        dts = 0
+        origin = None
+        for count, delta in self.time_runs:
+            for _ in range(count):
+                while ctts_left == 0:
+                    ctts_left, ctts_offset = next(ctts, (-1, ctts_offset))  # -1 = no more runs
+                ctts_left -= 1
+                pts = dts + ctts_offset
+                if origin is None:
+                    origin = pts
+                yield (pts - origin) / self.timescale
+                dts += delta
+
+    def iter_keyframes(self):
+        """Yield (sample_index, offset, size, pts_seconds) for every sync sample, sample_index 0-based"""
+        sync = self.sync_samples
+        next_sync = 0
+        for index, ((offset, size), pts) in enumerate(zip(self.iter_samples(), self.iter_sample_times()), 1):
+            if sync is not None:
+                if next_sync >= len(sync):
+                    return
+                if index != sync[next_sync]:
+                    continue
+                next_sync += 1
+            yield index - 1, offset, size, pts
+
+def _iter_sei_messages(rbsp):
+    """Yield (payload_type, payload) for each message in an unescaped SEI RBSP"""
+    pos = 0
+    while pos < len(rbsp) and rbsp[pos] != 0x80:  # 0x80 = rbsp trailing bits
+        values = []
+        for _ in range(2):  # payloadType, then payloadSize
+            value = 0
+            while rbsp[pos] == 0xFF:
+                value += 255
+                pos += 1
+            values.append(value + rbsp[pos])
+            pos += 1
+        payload_type, payload_size = values
+        yield payload_type, rbsp[pos:pos + payload_size]
+        pos += payload_size
+
+class SeiScanner:
+    """Incremental Annex B scanner for Dividia SEI records.
+
+    The stream can be fed in chunks of any size. SEI start codes (3- or
+    4-byte) are searched only in new data plus at most three bytes carried
+    over from the previous chunk, and only the bytes of SEI NAL units are
+    kept, so each byte is inspected once and memory stays bounded. Emulation-prevention bytes are
+    removed before the SEI messages are decoded. codec selects the H.264 or
+    HEVC (prefix SEI) NAL header.
+    """
+
+    MAX_SEI_NAL = 65536  # Larger SEI NAL units are skipped rather than buffered
+
+    def __init__(self, debug=False, codec="h264"):
+        self.debug = debug
+        # Start code + SEI NAL header (H.264 nal_ref_idc is always 0 for SEI)
+        self.sei_start = b'\x00\x00\x01' + CODECS[codec]["sei_header"]
+        self.camera = None        # First camera name found
+        self.start_time = None    # First HH:MM:SS found
+        self.bytes_scanned = 0
+        self.sei_count = 0
+        self._tail = b""          # Bytes that may begin a start code spanning chunks
+        self._sei = None          # Body of the SEI NAL being collected, if any
+
+    def feed(self, data):
+        """Scan the next chunk and return the (camera, time) records completed in it"""
+        self.bytes_scanned += len(data)
+        buf = self._tail + data if self._tail else data
+        records = []
+        pos = 0
+        while True:
+            if self._sei is not None:
+                # The SEI NAL runs up to the next start code (3- or 4-byte)
+                end = buf.find(b'\x00\x00\x01', pos)
+                if end == -1:
+                    break
+                self._collect(buf, pos, end)
+                self._finish_sei(records)
+                pos = end
+            start = buf.find(self.sei_start, pos)
+            if start == -1:
+                break
+            self._sei = bytearray()
+            pos = start + len(self.sei_start)
+
+        # Carry over only the bytes that could begin a start code spanning into
+        # the next chunk, so usually nothing is kept and no copy is made
+        if self._sei is not None:
+            keep = 2 if buf.endswith(b'\x00\x00') else 1 if buf.endswith(b'\x00') else 0
+            cut = max(len(buf) - keep, pos)
+            self._collect(buf, pos, cut)
+        else:
+            keep = next((k for k in range(len(self.sei_start) - 1, 0, -1) if buf.endswith(self.sei_start[:k])), 0)
+            cut = max(len(buf) - keep, pos)
+        self._tail = buf[cut:]
+        return records
+
+    def _collect(self, buf, start, end):
+        self._sei += buf[start:end]
+        if len(self._sei) > self.MAX_SEI_NAL:
+            self._sei = None
+
+    def _finish_sei(self, records):
+        nal, self._sei = self._sei, None
+        if nal is None:
+            return
+        self.sei_count += 1
+        try:
+            for payload_type, payload in _iter_sei_messages(bytes(nal).replace(b'\x00\x00\x03', b'\x00\x00')):
+                if self.debug and self.sei_count <= 3:
+                    log(f"  SEI #{self.sei_count}: type={payload_type}, size={len(payload)}, first 40 bytes: {payload[:40].hex()}")
+                if payload_type != 5:  # user_data_unregistered
+                    continue
+                cam, ts = parse_dividia_sei(payload, debug=self.debug and self.sei_count <= 3)
+                if cam:
+                    records.append((cam, ts))
+                    if self.camera is None:
+                        self.camera, self.start_time = cam, ts
+        except IndexError:
+            pass  # Truncated SEI message
+
+class Timeline:
+    """Recorder clock as a function of stream time, built from every SEI record.
+
+    Each record says the clock read seconds_today (whole seconds) at stream
+    time pts, which bounds the clock offset (clock - t) to [lo, hi). Records
+    are intersected into the current segment while they agree; one that
+    doesn't (dropped frames, a recording gap, a clock jump) starts a new
+    segment. Only segments are stored, in arrays, so memory depends on the
+    number of discontinuities and not on the file's length. Clock values are
+    unwrapped across midnight and across the 16-bit field wrapping at 65536;
+    hint (e.g. the start time in the filename) resolves the first record.
+    """
+
+    def __init__(self, hint=None):
+        self.starts = array('d')   # Stream time each segment begins
+        self.offsets = array('d')  # Clock offset (lower bound) of each segment
+        self.hint = hint
+        self._hi = 0.0
+        self.records = 0
+        self.dropped = 0
+
+    @classmethod
+    def linear(cls, start_seconds):
+        """The single-record timeline: the clock runs from start_seconds at t=0"""
+        timeline = cls()
+        timeline.add(0.0, start_seconds)
+        return timeline
+
+    @classmethod
+    def from_segments(cls, segments):
+        timeline = cls()
+        for start, offset in segments:
+            timeline.starts.append(start)
+            timeline.offsets.append(offset)
+        timeline._hi = math.inf
+        return timeline
+
+    def segments(self):
+        return list(zip(self.starts, self.offsets))
+
+    def shifted(self, delta):
+        """The same clock for a stream that starts delta seconds into this one"""
+        i = max(0, bisect.bisect_right(self.starts, delta) - 1)
+        starts = [0.0] + [start - delta for start in self.starts[i + 1:]]
+        return Timeline.from_segments(zip(starts, (offset + delta for offset in self.offsets[i:])))
+
+    def clock_at(self, t):
+        """Clock reading (seconds, unwrapped) shown at stream time t"""
+        i = max(0, bisect.bisect_right(self.starts, t) - 1)
+        return math.floor(self.offsets[i] + t + 1e-6)
+
+    def add(self, pts, seconds_today):
+        self.records += 1
+        clock = seconds_today
+        predicted = self.offsets[-1] + pts if self.starts else self.hint
+        if predicted is not None:
+            # Pick the reading of the wrapped fields closest to the expected clock
+            day = predicted // 86400 * 86400
+            clock = min((d + v for d in (day - 86400, day, day + 86400)
+                         for v in (seconds_today, seconds_today + 65536) if v < 86400),
+                        key=lambda c: abs(c - predicted))
+        lo, hi = clock - pts, clock + 1 - pts
+        if self.starts and max(lo, self.offsets[-1]) < min(hi, self._hi):
+            self.offsets[-1] = max(lo, self.offsets[-1])
+            self._hi = min(hi, self._hi)
+            return
+        if len(self.starts) >= TIMELINE_MAX_SEGMENTS:
+            self.dropped += 1
+            return
+        self.starts.append(pts)
+        self.offsets.append(lo)
+        self._hi = hi
+
+    def drawtext_clock(self):
+        """drawtext expression for the clock offset at time t (escaped for use inside text='...').
+
+        Only the first DRAWTEXT_MAX_SEGMENTS segments are drawn; callers that
+        can fall back to the ass renderer do so before it comes to that.
+        """
+        if len(self.starts) > DRAWTEXT_MAX_SEGMENTS:
+            log(f"  WARNING: Clock has {len(self.starts)} segments, drawing the first {DRAWTEXT_MAX_SEGMENTS}")
+        base = self.offsets[0]
+        terms = [f"{base:.3f}"]
+        for start, offset in zip(self.starts[1:DRAWTEXT_MAX_SEGMENTS], self.offsets[1:DRAWTEXT_MAX_SEGMENTS]):
+            terms.append(f"{offset - base:+.3f}*gte(t\\,{start:.3f})")
+            base = offset
+        return "".join(terms)
+
+    def cues(self, duration):
+        """Yield (start, end, clock) for each second shown over [0, duration)"""
+        for i, offset in enumerate(self.offsets):
+            t = 0.0 if i == 0 else self.starts[i]
+            seg_end = min(self.starts[i + 1] if i + 1 < len(self.starts) else duration, duration)
+            while t < seg_end:
+                clock = math.floor(offset + t + 1e-6)
+                end = min(clock + 1 - offset, seg_end)
+                yield t, end, clock
+                t = end
+
+def _sample_sei_records(buf, offset, size, length_size, codec="h264"):
+    """Yield (nal_size, camera, start_time) for each SEI NAL unit in one MP4 sample.
+
+    camera and start_time are None for SEI units without Dividia metadata.
+    Stops at the first slice, since (prefix) SEI always precedes it in the
+    access unit.
+    """
+    pos, end = offset, offset + size
+    while pos + length_size <= end:
+        nal_size = int.from_bytes(buf[pos:pos + length_size], 'big')
+        pos += length_size
+        if codec == "hevc":
+            nal_type, header = (buf[pos] >> 1) & 0x3F, 2
+            is_sei, is_slice = nal_type == 39, nal_type < 32
+        else:
+            nal_type, header = buf[pos] & 0x1F, 1
+            is_sei, is_slice = nal_type == 6, nal_type in (1, 5)
+        if is_sei:
+            nal = buf[pos + header:pos + nal_size]
+            cam = ts = None
+            for payload_type, payload in _iter_sei_messages(nal.replace(b'\x00\x00\x03', b'\x00\x00')):
+                if payload_type == 5:  # user_data_unregistered
+                    cam, ts = parse_dividia_sei(payload)
+                    if cam:
+                        break
+            yield nal_size, cam, ts
+        elif is_slice:
+            return
+        pos += nal_size
+
+def read_mp4_track(path):
+    """Mp4Track for the file's video track, or None if it can't be read"""
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return Mp4Track(mm)
+    except (OSError, ValueError, KeyError, IndexError, struct.error):
+        return None
+
+def mp4_duration(path, track=None):
+    """Video track duration in seconds from the MP4 header, or None if it can't be read"""
+    track = track or read_mp4_track(path)
+    return track.duration if track else None
+
+def mp4_is_complete(path):
+    """Cheap integrity check for an MP4 we wrote: every top-level box must fit in
+    the file and the moov index must be present. A killed encode leaves either
+    a truncated mdat or no moov, so it fails."""
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            types = [box_type for box_type, _, _ in _iter_boxes(mm, 0, len(mm))]
+    except (OSError, ValueError, struct.error):
+        return False
+    return b'moov' in types and b'mdat' in types
+
+def read_mp4_sei(path, max_samples=None, track=None):
+    """Find Dividia metadata by walking the MP4 sample table directly, without ffmpeg.
+
+    Only the first max_samples video samples are read (via mmap). track is
+    the file's Mp4Track if the caller has parsed it already. Returns
+    (camera, start_time, bytes_read); camera is None if the file is not a
+    plain MP4 the parser understands or has no metadata in those samples.
+    """
+    max_samples = NATIVE_PROBE_SAMPLES if max_samples is None else max_samples
+    bytes_read = 0
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            track = track or Mp4Track(mm)
+            for sample_idx, (offset, size) in enumerate(track.iter_samples()):
+                if sample_idx >= max_samples:
+                    break
+                for nal_size, cam, ts in _sample_sei_records(mm, offset, size, track.nal_length_size, track.codec):
+                    bytes_read += nal_size
+                    _probe_reads.consume(nal_size)
+                    if cam:
+                        log(f"  Native MP4 probe: cam='{cam}', time={ts} in sample {sample_idx + 1} ({bytes_read} bytes read)")
+                        return cam, ts, bytes_read
+    except (OSError, ValueError, KeyError, IndexError, struct.error) as e:
+        log(f"  Native MP4 probe unavailable ({e}), falling back to ffmpeg")
+        return None, None, bytes_read
+    log(f"  Native MP4 probe: no metadata in the first {max_samples} sample(s)")
+    return None, None, bytes_read
+
+_mount_table = None
+
+def is_local_file(path):
+    """Best guess whether path is on a local disk rather than a network share"""
+    global _mount_table
+    resolved = str(Path(path).resolve())
     if platform.system() == 'Windows':
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
-    
+        drive = os.path.splitdrive(resolved)[0]
+        if drive.startswith("\\\\"):
+            return False  # UNC path
+        return ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") != 4  # DRIVE_REMOTE
+    if _mount_table is None:
+        # {mount point: filesystem type}, from /proc/mounts on Linux or mount(8) on macOS
+        _mount_table = {}
+        try:
+            with open("/proc/mounts", encoding="utf-8") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 3:
+                        _mount_table[fields[1].replace("\\040", " ")] = fields[2]
+        except OSError:
+            try:
+                output = subprocess.run(["mount"], capture_output=True, text=True).stdout
+            except OSError:
+                output = ""
+            for match in re.finditer(r'^.* on (.*) \((\w+)', output, re.M):
+                _mount_table[match[1]] = match[2]
+    mount = max((m for m in _mount_table if resolved == m or resolved.startswith(m.rstrip('/') + '/')),
+                key=len, default=None)
+    return _mount_table.get(mount) not in NETWORK_FILESYSTEMS
+
+def scan_mapped_sei(path, max_bytes=None):
+    """Find Dividia metadata by scanning the memory-mapped file, without ffmpeg.
+
+    mmap.find() looks for the payload marker in place, so nothing is copied
+    except a candidate SEI unit: its bytes get a start code and go through
+    find_sei(). This works whatever the container (plain or fragmented MP4,
+    raw Annex B) as long as the stream isn't encrypted. Returns (camera,
+    start_time, bytes_read); camera is None if no record was found within
+    max_bytes.
+    """
+    max_bytes = PROBE_MAX_BYTES if max_bytes is None else max_bytes
+    marker = b'\xaa\xff' * 8
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = min(len(mm), max_bytes) if max_bytes > 0 else len(mm)
+            can_release = hasattr(mm, 'madvise')  # Not on Windows
+            if can_release:
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            pos = 0
+            for window in range(0, end, MMAP_RELEASE_BYTES):
+                # Windows overlap by a marker's length so one straddling the edge is still found
+                window_end = min(window + MMAP_RELEASE_BYTES + len(marker) - 1, end)
+                hit = mm.find(marker, pos, window_end)
+                while hit != -1:
+                    # The payload follows the SEI NAL header, payload type 5 and a one-byte size
+                    for codec, info in CODECS.items():
+                        start = hit - 2 - len(info["sei_header"])
+                        if start < 0 or mm[start:hit - 1] != info["sei_header"] + b'\x05':
+                            continue
+                        # A little slack past the payload for emulation-prevention bytes
+                        candidate = b'\x00\x00\x00\x01' + mm[start:min(hit + mm[hit - 1] + 16, len(mm))]
+                        cam, ts = find_sei(candidate, codec=codec)
+                        if cam:
+                            log(f"  Mapped probe: cam='{cam}', time={ts} at byte {hit} ({codec})")
+                            return cam, ts, hit
+                    pos = hit + 1
+                    hit = mm.find(marker, pos, window_end)
+                pos = max(pos, window_end - len(marker) + 1)
+                _probe_reads.consume(window_end - window)
+                if can_release:
+                    mm.madvise(mmap.MADV_DONTNEED, window, min(MMAP_RELEASE_BYTES, len(mm) - window))
+    except (OSError, ValueError) as e:
+        log(f"  Mapped probe unavailable ({e})")
+        return None, None, 0
+    log(f"  Mapped probe: no metadata in the first {end} bytes")
+    return None, None, end
+
+def read_mp4_timeline(path, track=None):
+    """Timeline from the SEI record of every keyframe, read through the MP4 sample table.
+
+    track is the file's Mp4Track if the caller has parsed it already.
+    Returns None if the file can't be parsed natively or has no records.
+    """
+    start = time.time()
+    # The recorder names files after the start time (cam1-20251114150213.mp4)
+    match = re.search(r'\d{8}(\d{2})(\d{2})(\d{2})', path.name)
+    timeline = Timeline(hint=int(match[1]) * 3600 + int(match[2]) * 60 + int(match[3]) if match else None)
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            track = track or Mp4Track(mm)
+            for _, offset, size, pts in track.iter_keyframes():
+                for nal_size, cam, ts in _sample_sei_records(mm, offset, size, track.nal_length_size, track.codec):
+                    _probe_reads.consume(nal_size)
+                    if ts:
+                        h, m, sec = map(int, ts.split(':'))
+                        timeline.add(pts, h * 3600 + m * 60 + sec)
+                        break
+    except (OSError, ValueError, KeyError, IndexError, struct.error) as e:
+        log(f"  Clock timeline unavailable ({e})")
+        return None
+    if not timeline.records:
+        return None
+    log(f"  Clock timeline: {timeline.records} SEI record(s), {len(timeline.starts)} segment(s) "
+        f"({time.time() - start:.2f}s)")
+    if timeline.dropped:
+        log(f"  WARNING: {timeline.dropped} clock discontinuities beyond the first {TIMELINE_MAX_SEGMENTS} were ignored")
+    return timeline
+
+def video_codec(path, startupinfo=None, track=None):
+    """Source video codec ("h264" or "hevc"), from the MP4 sample description or ffmpeg's stream info"""
+    track = track or read_mp4_track(path)
+    if track is not None:
+        return track.codec
+    result = subprocess.run([FFMPEG_PATH, "-hide_banner", "-i", str(path)], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, startupinfo=startupinfo)
+    match = re.search(rb'Video: (\w+)', result.stderr)
+    return "hevc" if match and match[1] == b"hevc" else "h264"
+
+def probe_sei(path, max_bytes=None, timeout=None, early_exit=None, startupinfo=None, codec=None):
+    """Stream the video through the Annex B extractor and look for Dividia metadata.
+
+    Returns (camera, start_time, bytes_read). With early exit enabled the
+    extractor is killed once the first metadata record is found; otherwise the
+    pipe is read to EOF. Either way the probe gives up after max_bytes or
+    timeout seconds without metadata. codec is detected if not given.
+    """
+    max_bytes = PROBE_MAX_BYTES if max_bytes is None else max_bytes
+    timeout = PROBE_TIMEOUT if timeout is None else timeout
+    early_exit = PROBE_EARLY_EXIT if early_exit is None else early_exit
+    codec = codec or video_codec(path, startupinfo)
+
+    probe_start = time.time()
     proc = subprocess.Popen(
-        [FFMPEG_PATH, "-i", str(path), "-c:v", "copy", "-bsf:v", "h264_mp4toannexb", "-f", "h264", "-"],
+        [FFMPEG_PATH, "-i", str(path), "-c:v", "copy", "-bsf:v", CODECS[codec]["bsf"], "-f", CODECS[codec]["format"], "-"],
         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, startupinfo=startupinfo
     )
-    chunk = b""
+    with progress_lock:
+        _active_procs.add(proc)
+
+    # The time budget is enforced from a timer so a stalled read on a slow
+    # share cannot hold the probe past its deadline
+    timed_out = threading.Event()
+    def on_timeout():
+        if ts_start is None:
+            timed_out.set()
+            proc.kill()
+    timer = threading.Timer(timeout, on_timeout) if timeout > 0 else None
+
+    scanner = SeiScanner(debug=True, codec=codec)
     cam = ts_start = None
     chunk_count = 0
-    while True:
-        data = proc.stdout.read(1048576)
-        if not data: break
-        chunk_count += 1
-        chunk += data
-        n, t = find_sei(chunk, debug=(chunk_count <= 2))  # Debug first 2 chunks
-        if n and not ts_start:  # Get first timestamp
-            cam, ts_start = n, t
-            log(f"  First metadata found: cam='{n}', time={t}")
-        chunk = chunk if len(chunk) < 100000 else chunk[-100000:]  # Keep buffer manageable
-    proc.wait()
-    proc.stdout.close()
-    log(f"Processed {chunk_count} chunk(s) of video data")
-
-    cam = cam or "NO CAMERA NAME"
-    ts_start = ts_start or "00:00:00"
-    
-    # Extract date from filename if available (format: cam1-20251114150213.mp4)
+    bytes_read = 0
+    stop_reason = "end of stream"
+    if timer:
+        timer.start()
     try:
-        # Look for pattern YYYYMMDD in filename
-        import re
-        match = re.search(r'(\d{8})', path.name)
-        if match:
-            date_str = match.group(1)
-            # Format as MM-DD-YYYY
-            date_display = f"{date_str[4:6]}-{date_str[6:8]}-{date_str[0:4]}"
-        else:
-            date_display = "Unknown Date"
-    except:
-        date_display = "Unknown Date"
-    
-    log(f"Camera: {cam}, Date: {date_display}, Start time: {ts_start}")
+        while True:
+            data = proc.stdout.read(1048576)
+            if not data:
+                if timed_out.is_set():
+                    stop_reason = f"time budget of {timeout:g}s"
+                break
+            chunk_count += 1
+            bytes_read += len(data)
+            _probe_reads.consume(len(data))
+            if scanner.feed(data) and not ts_start:  # Get first timestamp
+                cam, ts_start = scanner.camera, scanner.start_time
+                log(f"  First metadata found: cam='{cam}', time={ts_start}")
+                if early_exit:
+                    stop_reason = "metadata found"
+                    break
+            if not ts_start and max_bytes > 0 and bytes_read >= max_bytes:
+                stop_reason = f"byte budget of {max_bytes} bytes"
+                break
+    finally:
+        if timer:
+            timer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        with progress_lock:
+            _active_procs.discard(proc)
 
-    # Convert start time to seconds for gmtime offset
-    h, m, s = map(int, ts_start.split(':'))
-    start_seconds = h * 3600 + m * 60 + s
+    log(f"SEI probe ({codec}) read {bytes_read} bytes in {chunk_count} chunk(s), {scanner.sei_count} SEI unit(s) "
+        f"({time.time() - probe_start:.2f}s, stopped at {stop_reason})")
+    return cam, ts_start, bytes_read
 
-    # Try multiple font paths based on platform
-    if platform.system() == 'Windows':
-        font_paths = [
-            "C:/Windows/Fonts/arial.ttf",
-            "C:/Windows/Fonts/Arial.ttf",
-            "C:/Windows/Fonts/calibri.ttf"
-        ]
-    else:  # macOS
-        font_paths = [
-            "/System/Library/Fonts/Supplemental/Arial.ttf",
-            "/System/Library/Fonts/Helvetica.ttc",
-            "/System/Library/Fonts/SFNSText.ttf",
-            "/Library/Fonts/Arial.ttf"
-        ]
-    
-    font = None
-    for fp in font_paths:
-        if Path(fp).exists():
-            font = fp
-            log(f"Using font: {fp}")
-            break
-    
-    # Escape for ffmpeg
-    safe_cam = cam.replace("\\", "\\\\").replace("'", "'\\''").replace(":", "\\:")
-    safe_date = date_display.replace("\\", "\\\\").replace("'", "'\\''").replace(":", "\\:")
-    
-    # Create three text overlays: camera name, date, and dynamic time
-    # For time, build the format string using expr to concatenate hours, minutes, seconds
-    # Calculate offset seconds and use eif/expr to build HH:MM:SS string
-    time_expr = (
-        f"%{{eif\\:mod(trunc(({start_seconds}+t)/3600)\\,24)\\:d\\:2}}\\:"
-        f"%{{eif\\:mod(trunc(({start_seconds}+t)/60)\\,60)\\:d\\:2}}\\:"
-        f"%{{eif\\:mod(trunc({start_seconds}+t)\\,60)\\:d\\:2}}"
-    )
-    
-    if not font:
-        log("WARNING: No standard font found, using FFmpeg default")
-        vf = (f"drawtext=fontsize=48:fontcolor=white:borderw=4:bordercolor=black:x=20:y=main_h-180:text='{safe_cam}',"
-              f"drawtext=fontsize=48:fontcolor=white:borderw=4:bordercolor=black:x=20:y=main_h-120:text='{safe_date}',"
-              f"drawtext=fontsize=48:fontcolor=white:borderw=4:bordercolor=black:x=20:y=main_h-60:text='{time_expr}'")
-    else:
-        vf = (f"drawtext=fontfile={font}:fontsize=48:fontcolor=white:borderw=4:bordercolor=black:x=20:y=main_h-180:text='{safe_cam}',"
-              f"drawtext=fontfile={font}:fontsize=48:fontcolor=white:borderw=4:bordercolor=black:x=20:y=main_h-120:text='{safe_date}',"
-              f"drawtext=fontfile={font}:fontsize=48:fontcolor=white:borderw=4:bordercolor=black:x=20:y=main_h-60:text='{time_expr}'")
+class MetadataIndex:
+    """SQLite cache of probe results and burned outputs, shared by worker threads.
 
-    # Create output directory 'with_overlay' in the same folder as the input video
-    output_dir = path.parent / "with_overlay"
-    try:
-        output_dir.mkdir(exist_ok=True)
-        log(f"Output directory: {output_dir}")
-    except PermissionError:
-        error_msg = f"ERROR: Cannot create directory {output_dir} - permission denied"
-        log(error_msg)
-        subprocess.run([
-            "osascript", "-e",
-            f'display dialog "Permission Error\\n\\nCannot create output folder:\\n{output_dir}\\n\\nPlease check folder permissions." buttons {{"OK"}} with title "Overlay Burner Error" with icon stop'
-        ])
-        return
-    except Exception as e:
-        error_msg = f"ERROR: Failed to create directory {output_dir}: {e}"
-        log(error_msg)
-        subprocess.run([
-            "osascript", "-e",
-            f'display dialog "Error Creating Folder\\n\\n{str(e)}\\n\\nCannot create output folder at:\\n{output_dir}" buttons {{"OK"}} with title "Overlay Burner Error" with icon stop'
-        ])
-        return
-    
-    out = output_dir / (path.stem + "_overlay.mp4")
+    A source file's row is only trusted while its size and mtime match, so an
+    edited or replaced recording is probed again. Outputs are recorded with
+    their size, mtime and a fingerprint so a later run can tell a finished
+    file from one that was truncated or replaced.
 
-    cmd = [FFMPEG_PATH, "-i", str(path), "-vf", vf, "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23", "-c:a", "copy", "-strict", "-2", "-y", str(out)]
-    log(f"FFmpeg command: {' '.join(cmd)}")
-    log(f"Video filter: {vf}")
-    
-    # Windows: hide console window completely
-    startupinfo = None
-    if platform.system() == 'Windows':
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = subprocess.SW_HIDE
-    
-    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, startupinfo=startupinfo)
-    
-    elapsed = time.time() - start_time
-    
-    if result.returncode == 0:
-        log(f"Created: {out.name} in {output_dir.name}/ (took {elapsed:.1f}s)")
-        if progress_data is not None:
-            progress_data['success'] += 1
-        return "success"
-    else:
-        err = result.stderr.decode(errors='ignore')
-        log(f"FFmpeg error (full output):")
-        log(err)
-        if progress_data is not None:
-            progress_data['failed'] += 1
-        return "failed"
+    The status column doubles as a job journal: a file is queued when it is
+    handed to the workers and moves through probing and encoding to done or
+    failed, so after a crash or reboot the rows still queued, probing or
+    encoding are the work that was cut off.
+    """
 
-def main():
-    log("=== Overlay Burner Started ===")
-    log(f"Arguments received: {sys.argv}")
+    UNFINISHED = ("queued", "probing", "encoding")
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    probed INTEGER NOT NULL DEFAULT 0,
+                    camera TEXT,
+                    start_time TEXT,
+                    start_seconds INTEGER,
+                    date_display TEXT,
+                    duration REAL,
+                    output_path TEXT,
+                    output_size INTEGER,
+                    output_mtime_ns INTEGER,
+                    output_hash TEXT,
+                    status TEXT,
+                    updated REAL
+                )""")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(files)")}
+            if "timeline" not in columns:  # Added after the first release of the index
+                self._db.execute("ALTER TABLE files ADD COLUMN timeline TEXT")
+
+    def lookup(self, path):
+        """Return the row for path if the file is unchanged since it was indexed"""
+        st = path.stat()
+        with self._lock:
+            row = self._db.execute("SELECT * FROM files WHERE path = ?", (str(path),)).fetchone()
+        if row is None or row['size'] != st.st_size or row['mtime_ns'] != st.st_mtime_ns:
+            return None
+        return row
+
+    def _upsert(self, path, **fields):
+        self._upsert_many([(path, path.stat())], **fields)
+
+    def _upsert_many(self, entries, **fields):
+        """Write the same fields for each (path, stat result) in one transaction"""
+        fields.update(size=None, mtime_ns=None, updated=time.time())
+        columns = ", ".join(fields)
+        updates = ", ".join(f"{k} = excluded.{k}" for k in fields)
+        with self._lock, self._db:
+            for path, st in entries:
+                fields.update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+                # A changed source invalidates everything recorded about it
+                self._db.execute("DELETE FROM files WHERE path = ? AND (size != ? OR mtime_ns != ?)",
+                                 (str(path), st.st_size, st.st_mtime_ns))
+                self._db.execute(f"INSERT INTO files (path, {columns}) VALUES (?, {', '.join('?' * len(fields))}) "
+                                 f"ON CONFLICT(path) DO UPDATE SET {updates}",
+                                 (str(path), *fields.values()))
+
+    def record_probe(self, path, camera, start_time, date_display, duration, timeline=None):
+        start_seconds = None
+        if start_time:
+            h, m, sec = map(int, start_time.split(':'))
+            start_seconds = h * 3600 + m * 60 + sec
+        self._upsert(path, probed=1, camera=camera, start_time=start_time, start_seconds=start_seconds,
+                     date_display=date_display, duration=duration,
+                     timeline=json.dumps(timeline.segments()) if timeline else None)
+
+    def record_output(self, path, out, status):
+        if status == "done":
+            st = out.stat()
+            self._upsert(path, status=status, output_path=str(out), output_size=st.st_size,
+                         output_mtime_ns=st.st_mtime_ns, output_hash=file_fingerprint(out))
+        else:
+            self._upsert(path, status=status, output_path=str(out), output_size=None,
+                         output_mtime_ns=None, output_hash=None)
+
+    def record_state(self, path, state):
+        self._upsert(path, status=state)
+
+    def record_queued(self, entries):
+        """Journal files handed to the workers but not started yet.
+
+        entries are (path, stat result) pairs, stat results the caller already
+        has (from discovery), so queuing a batch costs no I/O on the sources.
+        """
+        if entries:
+            self._upsert_many(entries, status="queued")
+
+    def unfinished(self):
+        """Paths and states of files a previous run started but never finished"""
+        with self._lock:
+            rows = self._db.execute(f"SELECT path, status FROM files WHERE status IN "
+                                    f"({', '.join('?' * len(self.UNFINISHED))})", self.UNFINISHED).fetchall()
+        return [(Path(row['path']), row['status']) for row in rows]
+
+    def output_is_complete(self, path, out):
+        """Decide whether an existing output can be trusted as finished.
+
+        If the index recorded this exact output (same size and mtime) no I/O
+        beyond a stat is needed; otherwise the file's box structure is checked
+        and, if sound, the output is recorded for next time.
+        """
+        row = self.lookup(path)
+        st = out.stat()
+        if (row is not None and row['status'] == "done" and row['output_path'] == str(out) and
+                row['output_size'] == st.st_size and row['output_mtime_ns'] == st.st_mtime_ns):
+            return True
+        if not mp4_is_complete(out):
+            return False
+        self.record_output(path, out, "done")
+        return True
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """Open the metadata index on first use; None if disabled or unavailable"""
+    global _index, USE_INDEX
+    with _index_lock:
+        if _index is None and USE_INDEX:
+            try:
+                _index = MetadataIndex(INDEX_FILE)
+                log(f"Metadata index: {INDEX_FILE}")
+            except (sqlite3.Error, OSError) as e:
+                log(f"WARNING: Metadata index unavailable ({e}), probing every file")
+                USE_INDEX = False
+        return _index
+
+def unfinished_jobs(roots, files=()):
+    """(path, stat result) of the files under roots that the journal shows a previous run was cut off in.
+
+    The caller runs these first. Their outputs were never renamed into
+    place, so the normal output check burns them again.
+    """
+    index = get_index()
+    if index is None:
+        return []
+    selected = {Path(f) for f in files}
+    unfinished = []
+    for path, state in index.unfinished():
+        if path in selected or any(root in path.parents for root in roots):
+            try:
+                unfinished.append((path, path.stat(), state))
+            except OSError:
+                pass  # Deleted since
+    if unfinished:
+        log(f"Resuming: {len(unfinished)} file(s) were unfinished when the previous run stopped")
+        for path, _, state in unfinished:
+            log(f"  {path.name} (was {state})")
+    return [(path, st) for path, st, _ in unfinished]
+
+def file_fingerprint(path, block=65536):
+    """Cheap content fingerprint: size plus the first and last 64 KB"""
+    h = hashlib.sha1()
+    size = path.stat().st_size
+    h.update(str(size).encode())
+    with open(path, 'rb') as f:
+        h.update(f.read(block))
+        if size > block:
+            f.seek(max(block, size - block))
+            h.update(f.read(block))
+    return h.hexdigest()
+
+def _run_ffmpeg(cmd, startupinfo=None, on_progress=None):
+    """Run ffmpeg to completion, registered so a cancelled batch can terminate it.
+
+    With on_progress, ffmpeg reports through -progress on stdout and the
+    callback gets each report as a dict (frame, fps, out_time_us, speed...).
+    """
+    if on_progress is None:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, startupinfo=startupinfo)
+        with progress_lock:
+            _active_procs.add(proc)
+        try:
+            _, stderr = proc.communicate()
+        finally:
+            with progress_lock:
+                _active_procs.discard(proc)
+        return proc.returncode, stderr
+
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    # stderr goes to a temp file so it can't fill up while we read stdout
+    with tempfile.TemporaryFile() as err_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err_file, startupinfo=startupinfo)
+        with progress_lock:
+            _active_procs.add(proc)
+        try:
+            report = {}
+            for line in proc.stdout:
+                key, _, value = line.decode(errors='ignore').strip().partition('=')
+                if key == "progress":  # Last key of each report
+                    on_progress(report)
+                    report = {}
+                elif key:
+                    report[key] = value.strip()
+            proc.wait()
+        finally:
+            proc.stdout.close()
+            with progress_lock:
+                _active_procs.discard(proc)
+        err_file.seek(0)
+        return proc.returncode, err_file.read()
+
+def job_progress(progress_data, path, duration):
+    """Progress callback storing one job's state in progress_data['jobs'][str(path)].
+
+    Called with an ffmpeg -progress report; fraction is derived from the
+    report's out_time and the clip duration unless given directly.
+    """
+    if progress_data is None:
+        return None
+    def update(report, fraction=None):
+        try:
+            out_time = int(report.get('out_time_us', 0)) / 1e6
+        except ValueError:
+            out_time = 0.0  # "N/A" before the first frame
+        if fraction is None and duration:
+            fraction = min(1.0, out_time / duration)
+        job = {'name': path.name, 'frame': report.get('frame'), 'fps': report.get('fps'),
+               'out_time': out_time, 'speed': report.get('speed'), 'fraction': fraction}
+        with progress_lock:
+            progress_data.setdefault('jobs', {})[str(path)] = job
+    return update
+
+def job_label(job):
+    """One-line status of a running job, e.g. cam1.mp4 - 42% (3.1x)"""
+    label = job['name']
+    if job.get('fraction') is not None:
+        label += f" - {job['fraction']:.0%}"
+    if job.get('speed') and job['speed'] != "N/A":
+        label += f" ({job['speed']})"
+    return label
+
+def _cpu_times():
+    """(busy, total) CPU time counters for the whole system, or None where unavailable"""
+    if platform.system() == 'Windows':
+        idle, kernel, user = (ctypes.c_ulonglong() for _ in range(3))
+        if not ctypes.windll.kernel32.GetSystemTimes(ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user)):
+            return None
+        return kernel.value + user.value - idle.value, kernel.value + user.value  # Kernel time includes idle
+    try:
+        with open("/proc/stat", encoding="ascii") as f:
+            fields = [int(v) for v in f.readline().split()[1:9]]
+    except (OSError, ValueError):
+        return None
+    return sum(fields) - fields[3] - fields[4], sum(fields)  # Idle and iowait aren't busy
+
+def cpu_percent(previous):
+    """System CPU use since previous (a _cpu_times() sample). Returns (percent, sample).
+
+    Without CPU counters (macOS) the one-minute load average is used instead.
+    """
+    sample = _cpu_times()
+    if sample is None:
+        try:
+            return min(100.0, os.getloadavg()[0] / CPU_COUNT * 100), None
+        except (AttributeError, OSError):
+            return None, None
+    if previous is None or sample[1] <= previous[1]:
+        return None, sample
+    return (sample[0] - previous[0]) * 100.0 / (sample[1] - previous[1]), sample
+
+class LoadMonitor(threading.Thread):
+    """Adapts the number of concurrent encodes to keep system CPU use under MAX_CPU"""
+
+    def __init__(self, slots, max_cpu):
+        super().__init__(daemon=True)
+        self.slots = slots
+        self.max_cpu = max_cpu
+        self._stopped = threading.Event()
+
+    def run(self):
+        _, sample = cpu_percent(None)
+        while not self._stopped.wait(SCHED_INTERVAL):
+            percent, sample = cpu_percent(sample)
+            if percent is None:
+                continue
+            if percent > self.max_cpu:
+                if self.slots.resize(self.slots.limit - 1):
+                    log(f"CPU at {percent:.0f}% (limit {self.max_cpu:g}%): {self.slots.limit} encode(s) at once")
+            elif percent < self.max_cpu - SCHED_HEADROOM and self.slots.active >= self.slots.limit:
+                if self.slots.resize(self.slots.limit + 1):
+                    log(f"CPU at {percent:.0f}% (limit {self.max_cpu:g}%): {self.slots.limit} encode(s) at once")
+
+    def stop(self):
+        self._stopped.set()
+
+def start_load_monitor():
+    """Start adapting encode concurrency if OVERLAY_MAX_CPU is set; returns the monitor or None"""
+    if MAX_CPU <= 0:
+        return None
+    monitor = LoadMonitor(_encode_slots, MAX_CPU)
+    monitor.start()
+    log(f"Adapting encode concurrency (1-{_encode_slots.maximum}) to keep CPU use under {MAX_CPU:g}%")
+    return monitor
+
+def apply_process_priority():
+    """Lower this process's CPU and disk priority per NICE and IO_PRIORITY; ffmpeg children inherit both"""
+    system = platform.system()
+    if NICE > 0:
+        try:
+            if system == 'Windows':
+                from ctypes import wintypes
+                # BELOW_NORMAL_PRIORITY_CLASS or IDLE_PRIORITY_CLASS, inherited by child processes
+                priority_class = 0x40 if NICE >= 15 else 0x4000
+                kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+                # The pseudo handle is -1, which the default int return type would truncate on 64-bit
+                kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+                kernel32.SetPriorityClass.argtypes = (wintypes.HANDLE, wintypes.DWORD)
+                if not kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), priority_class):
+                    raise ctypes.WinError(ctypes.get_last_error())
+            else:
+                os.nice(NICE)
+            log(f"CPU priority lowered (nice {NICE})")
+        except OSError as e:
+            log(f"WARNING: Could not lower CPU priority: {e}")
+    if IO_PRIORITY not in ("low", "idle"):
+        if IO_PRIORITY != "normal":
+            log(f"WARNING: Unknown I/O priority '{IO_PRIORITY}', leaving it unchanged")
+        return
+    result, error = -1, 0
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True) if system != 'Windows' else None
+    if system == 'Linux':
+        # ioprio_set(IOPRIO_WHO_PROCESS, 0, class << 13 | level): best-effort level 7, or the idle class
+        syscall = {"x86_64": 251, "aarch64": 30, "arm64": 30, "i686": 289}.get(platform.machine())
+        if syscall:
+            result = libc.syscall(syscall, 1, 0, (3 << 13) if IO_PRIORITY == "idle" else (2 << 13) | 7)
+            error = ctypes.get_errno()
+    elif system == 'Darwin':
+        # setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_PROCESS, IOPOL_THROTTLE or IOPOL_UTILITY)
+        result = libc.setiopolicy_np(0, 0, 3 if IO_PRIORITY == "idle" else 4)
+        error = ctypes.get_errno()
+    if result == 0:
+        log(f"I/O priority set to {IO_PRIORITY}")
+    elif error:
+        log(f"WARNING: Could not set the I/O priority to {IO_PRIORITY}: {os.strerror(error)}")
+    else:
+        log(f"WARNING: Could not set the I/O priority to {IO_PRIORITY} on this platform")
+
+def throughput_summary(elapsed, nbytes, files):
+    """Run summary lines: overall source throughput, then per encode concurrency used"""
+    if elapsed <= 0 or not files:
+        return ""
+    lines = [f"Throughput: {nbytes / 1e6 / elapsed:.1f} MB/s of source video, {files * 60 / elapsed:.1f} file(s)/min"]
+    for limit, seconds, limit_bytes in _encode_slots.throughput():
+        if seconds >= 1:
+            mins, secs = divmod(int(seconds), 60)
+            lines.append(f"  {limit} encode(s) at once: {mins}m {secs}s, {limit_bytes / 1e6 / seconds:.1f} MB/s")
+    return "\n".join(lines)
+
+def terminate_active_processes():
+    """Kill every running ffmpeg started by the batch (used when the user cancels)"""
+    with progress_lock:
+        procs = list(_active_procs)
+    for proc in procs:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+class VideoDiscovery:
+    """Finds source videos under the selected folders on background threads.
+
+    Directories are listed with os.scandir, several at once since listing is
+    latency bound on network shares. with_overlay/ folders are not descended
+    into; each is listed once instead, and its names tell the workers which
+    sources already have an output, sparing them a stat per file. Videos are
+    handed over as soon as their directory has been listed, so processing
+    starts while the rest of the tree is still being searched.
+    """
+
+    def __init__(self, roots, files=(), threads=DISCOVERY_THREADS):
+        self.count = 0          # Videos handed out by take()
+        self.finished = False   # Set once take() has returned the last video
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stopped = False
+        for path in files:
+            has_output = (path.parent / "with_overlay" / (path.stem + "_overlay.mp4")).exists()
+            self._queue.put((path, has_output, path.stat()))
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        if not roots:
+            self._queue.put(None)
+        # Count every root before scanning any, so a root that is listed at
+        # once can't end the search while the others are still being submitted
+        self._pending = len(roots)
+        for root in roots:
+            self._pool.submit(self._scan, root)
+
+    def _submit(self, directory):
+        with self._lock:
+            if self._stopped:
+                return
+            self._pending += 1
+        self._pool.submit(self._scan, directory)
+
+    def _scan(self, directory):
+        try:
+            videos, subdirs, outputs = [], [], None
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir() and not entry.is_symlink():
+                        if entry.name == "with_overlay":
+                            with os.scandir(entry.path) as done:
+                                outputs = {e.name for e in done}
+                        else:
+                            subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(".mp4") and "_overlay.mp4" not in entry.name.lower():
+                        try:
+                            st = entry.stat()  # Free on Windows, where scandir returns it
+                        except OSError:
+                            st = None
+                        videos.append((entry.name, st))
+            for sub in sorted(subdirs):
+                self._submit(sub)
+            for name, st in sorted(videos, key=lambda video: video[0]):
+                has_output = outputs is not None and (Path(name).stem + "_overlay.mp4") in outputs
+                self._queue.put((Path(directory) / name, has_output, st))
+        except OSError as e:
+            log(f"WARNING: Could not list {directory}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                last = self._pending == 0
+            if last:
+                self._queue.put(None)  # Every directory has been listed
+                self._pool.shutdown(wait=False)
+
+    def take(self, timeout=0):
+        """Return the (path, has_output, stat result) entries found so far, waiting up to timeout for the first.
+
+        The stat result is None if the file couldn't be stat'ed while listing.
+        """
+        items = []
+        try:
+            item = self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+            while item is not None:
+                items.append(item)
+                item = self._queue.get_nowait()
+            self.finished = True
+        except queue.Empty:
+            pass
+        self.count += len(items)
+        return items
+
+    def take_all(self):
+        """Block until the search is finished and return everything not taken yet"""
+        items = []
+        while not self.finished:
+            items += self.take(timeout=0.5)
+        return items
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+class LeaseQueue:
+    """Lease files that let workers on several machines share a folder of videos.
+
+    claim() is atomic on local and network file systems alike: a new lease
+    is created with O_EXCL, and an expired one is first renamed away, which
+    only one of the workers racing for it can do.
+    """
+
+    def __init__(self, worker_id, ttl):
+        self.worker_id = re.sub(r'[^\w.-]', '_', worker_id)
+        self.ttl = ttl
+        self._held = set()
+        self._seen = {}  # Lease held by another worker -> ((mtime_ns, size), when that was first seen)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._renew, daemon=True).start()
+
+    @staticmethod
+    def lease_path(out):
+        return out.with_name(out.name + ".lease")
+
+    def holder(self, out):
+        return self._worker_of(self.lease_path(out))
+
+    @staticmethod
+    def _worker_of(lease):
+        try:
+            return json.loads(lease.read_text(encoding="utf-8"))["worker"]
+        except (OSError, ValueError, KeyError):
+            return "unknown worker"
+
+    def holds(self, out):
+        """Whether this worker still holds the lease on out (it may have been taken over)"""
+        lease = self.lease_path(out)
+        with self._lock:
+            if lease not in self._held:
+                return False
+        return self._worker_of(lease) == self.worker_id
+
+    @staticmethod
+    def failure_path(out):
+        return out.with_name(out.name + ".failed")
+
+    def failure(self, out):
+        """The failure marker on out as a dict, or None if no worker has failed on it"""
+        try:
+            marker = json.loads(self.failure_path(out).read_text(encoding="utf-8"))
+            return marker if isinstance(marker.get("attempts"), int) else None
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def record_failure(self, out, error):
+        """Count a failed attempt on out. Only the lease holder writes, so attempts add up."""
+        previous = self.failure(out)
+        marker = {"attempts": (previous["attempts"] if previous else 0) + 1, "worker": self.worker_id,
+                  "host": HOST_NAME, "error": error[-500:], "date": time.strftime('%Y-%m-%d %H:%M:%S')}
+        path = self.failure_path(out)
+        tmp = path.with_name(f"{path.name}.{self.worker_id}.tmp")
+        try:
+            tmp.write_text(json.dumps(marker), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            log(f"WARNING: Could not write {path.name}: {e}")
+        return marker["attempts"]
+
+    def clear_failure(self, out):
+        try:
+            self.failure_path(out).unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def claim(self, out):
+        """Take the lease on out. False while another worker holds a live lease on it."""
+        lease = self.lease_path(out)
+        out.parent.mkdir(exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    st = lease.stat()
+                except FileNotFoundError:
+                    continue  # Released meanwhile
+                signature, now = (st.st_mtime_ns, st.st_size), time.monotonic()
+                with self._lock:
+                    seen = self._seen.get(lease)
+                    if seen is None or seen[0] != signature:
+                        self._seen[lease] = (signature, now)
+                        return False
+                if now - seen[1] < self.ttl:
+                    return False
+                stale = lease.with_name(f"{lease.name}.{self.worker_id}.stale")
+                try:
+                    os.rename(lease, stale)
+                except OSError:
+                    return False  # Another worker got there first
+                dead = self._worker_of(stale)
+                log(f"Lease on {out.name} held by {dead} not renewed for {self.ttl:g}s, taking the file over")
+                for leftover in (out.with_name(f"{out.name}.{dead}.part"), stale):
+                    try:
+                        leftover.unlink(missing_ok=True)
+                    except OSError:
+                        pass  # Still open on Windows if the worker's ffmpeg outlived it
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"worker": self.worker_id, "host": HOST_NAME, "pid": os.getpid(),
+                           "claimed": time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+            with self._lock:
+                self._held.add(lease)
+                self._seen.pop(lease, None)
+            return True
+        return False
+
+    def release(self, out):
+        lease = self.lease_path(out)
+        with self._lock:
+            if lease not in self._held:
+                return
+            self._held.discard(lease)
+        if self.holder(out) == self.worker_id:  # Not if it was taken over meanwhile
+            lease.unlink(missing_ok=True)
+
+    def close(self):
+        self._stopped.set()
+
+    def _renew(self):
+        while not self._stopped.wait(self.ttl / 4):
+            with self._lock:
+                held = list(self._held)
+            for lease in held:
+                holder = self._worker_of(lease)
+                if holder != self.worker_id:
+                    # Taken over by a worker that thought this one was dead
+                    with self._lock:
+                        self._held.discard(lease)
+                    log(f"WARNING: Lost {lease.name} to another worker ({holder}), no longer renewing it")
+                    continue
+                try:
+                    os.utime(lease)
+                except OSError as e:
+                    log(f"WARNING: Could not renew {lease.name}: {e}")
+
+_leases = None  # LeaseQueue when running as a --worker
+
+def process(path, current_num=1, total_num=1, progress_data=None, has_output=None):
+    """Probe and burn one file. Safe to call from several worker threads at once.
+
+    has_output: whether with_overlay/ already holds an output for this file,
+    if the caller knows (see VideoDiscovery); None means check here.
+    """
+    _log_context.name = path.name if BATCH_WORKERS > 1 else None
+    if progress_data is not None:
+        with progress_lock:
+            progress_data['current'] = current_num
+            progress_data['current_file'] = path.name
+            progress_data.setdefault('active', []).append(path.name)
+    try:
+        return _process_file(path, progress_data, has_output)
+    finally:
+        if _leases is not None:
+            _leases.release(path.parent / "with_overlay" / (path.stem + "_overlay.mp4"))
+        _log_context.name = None
+        if progress_data is not None:
+            with progress_lock:
+                progress_data['active'].remove(path.name)
+                progress_data.get('jobs', {}).pop(str(path), None)
+
+def date_from_filename(path):
+    """Extract the recording date from the filename (format: cam1-20251114150213.mp4) as MM-DD-YYYY"""
+    try:
+        # Look for pattern YYYYMMDD in filename
+        match = re.search(r'(\d{8})', path.name)
+        if match:
+            date_str = match.group(1)
+            # Format as MM-DD-YYYY
+            return f"{date_str[4:6]}-{date_str[6:8]}-{date_str[0:4]}"
+    except:
+        pass
+    return "Unknown Date"
+
+_overlay_font = None
+_static_layers = {}    # (camera, date, width) -> PNG path, or None if it couldn't be rendered
+_static_layer_dir = None
+_static_layer_lock = threading.Lock()
+
+def overlay_font():
+    """Font file for drawtext, or "" for ffmpeg's default. Looked up once per run."""
+    global _overlay_font
+    if _overlay_font is not None:
+        return _overlay_font
+
+    # Try multiple font paths based on platform
+    if platform.system() == 'Windows':
+        font_paths = [
+            "C:/Windows/Fonts/arial.ttf",
+            "C:/Windows/Fonts/Arial.ttf",
+            "C:/Windows/Fonts/calibri.ttf"
+        ]
+    else:  # macOS
+        font_paths = [
+            "/System/Library/Fonts/Supplemental/Arial.ttf",
+            "/System/Library/Fonts/Helvetica.ttc",
+            "/System/Library/Fonts/SFNSText.ttf",
+            "/Library/Fonts/Arial.ttf"
+        ]
+    
+    font = ""
+    for fp in font_paths:
+        if Path(fp).exists():
+            font = fp
+            log(f"Using font: {fp}")
+            break
+    if not font:
+        log("WARNING: No standard font found, using FFmpeg default")
+    _overlay_font = font
+    return font
+
+def _drawtext(text, y, scale=1):
+    """drawtext filter in the overlay style, its size scaled by scale; text must already be escaped"""
+    font = overlay_font()
+    style = TEXT_STYLE if scale == 1 else re.sub(
+        r'(fontsize|borderw)=(\d+)', lambda m: f"{m[1]}={max(1, round(int(m[2]) * scale))}", TEXT_STYLE)
+    return f"drawtext={f'fontfile={font}:' if font else ''}{style}:x={round(20 * scale)}:y={y}:text='{text}'"
+
+def _escape_text(text):
+    return text.replace("\\", "\\\\").replace("'", "'\\''").replace(":", "\\:")
+
+def static_text_layer(cam, date_display, width):
+    """Transparent PNG with the camera name and date, rendered once per (camera, date, width).
+
+    Returns None if ffmpeg couldn't render it; the caller draws the text
+    with drawtext instead.
+    """
+    global _static_layer_dir
+    key = (cam, date_display, width)
+    with _static_layer_lock:
+        if key in _static_layers:
+            return _static_layers[key]
+        if _static_layer_dir is None:
+            _static_layer_dir = Path(tempfile.mkdtemp(prefix="overlay-text-"))
+            atexit.register(shutil.rmtree, _static_layer_dir, ignore_errors=True)
+        png = _static_layer_dir / f"layer{len(_static_layers)}.png"
+        # Same rows as the drawtext chain: main_h-180 and main_h-120, relative to the layer's top
+        top = STATIC_LAYER_TOP
+        vf = ",".join([_drawtext(_escape_text(cam), top - 180), _drawtext(_escape_text(date_display), top - 120)])
+        result = subprocess.run([FFMPEG_PATH, "-v", "error", "-f", "lavfi", "-i",
+                                 f"color=c=black@0.0:s={width}x{STATIC_LAYER_HEIGHT},format=rgba",
+                                 "-vf", vf, "-frames:v", "1", "-y", str(png)],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0 or not png.exists():
+            detail = result.stderr.decode(errors='ignore').strip().splitlines()
+            log(f"WARNING: Couldn't render the static text layer ({detail[-1] if detail else result.returncode}), "
+                f"using drawtext for every line")
+            png = None
+        else:
+            log(f"Rendered static text layer for '{cam}' {date_display} at width {width}")
+        _static_layers[key] = png
+        return png
+
+def build_overlay_filter(cam, date_display, ts_start, timeline=None, width=None, scale=1):
+    """Build the filter chain for the camera, date and running clock overlay.
+
+    With the static text layer and a known frame width, the camera and date
+    come from a cached PNG (a graph fed by movie=, its main input labelled
+    [in]) and only the clock is drawn with drawtext. scale shrinks the text
+    and its rows for small frames such as mosaic tiles (drawtext only).
+    """
+    # Convert start time to seconds for gmtime offset
+    h, m, s = map(int, ts_start.split(':'))
+    start_seconds = h * 3600 + m * 60 + s
+    if timeline is not None:
+        # Clock read from every SEI record: the offset steps at each discontinuity in the recording
+        start_seconds = f"({timeline.drawtext_clock()})"
+
+    # Escape for ffmpeg
+    safe_cam = _escape_text(cam)
+    safe_date = _escape_text(date_display)
+    
+    # Create three text overlays: camera name, date, and dynamic time
+    # For time, build the format string using expr to concatenate hours, minutes, seconds
+    # Calculate offset seconds and use eif/expr to build HH:MM:SS string
+    time_expr = (
+        f"%{{eif\\:mod(trunc(({start_seconds}+t)/3600)\\,24)\\:d\\:2}}\\:"
+        f"%{{eif\\:mod(trunc(({start_seconds}+t)/60)\\,60)\\:d\\:2}}\\:"
+        f"%{{eif\\:mod(trunc({start_seconds}+t)\\,60)\\:d\\:2}}"
+    )
+    
+    layer = static_text_layer(cam, date_display, width) if STATIC_TEXT_LAYER and width and scale == 1 else None
+    if layer is not None:
+        return (f"movie=filename={_filter_path(layer)}[static];"
+                f"[in][static]overlay=0:main_h-{STATIC_LAYER_TOP}:format=auto,{_drawtext(time_expr, 'main_h-60')}")
+    cam_row, date_row, clock_row = (f"main_h-{round(offset * scale)}" for offset in (180, 120, 60))
+    return ",".join([_drawtext(safe_cam, cam_row, scale), _drawtext(safe_date, date_row, scale),
+                     _drawtext(time_expr, clock_row, scale)])
+
+def default_encoder_profile():
+    """Profile from OVERLAY_ENCODER_PROFILE, else the last calibration, else 'fast'"""
+    if ENCODER_PROFILE:
+        if ENCODER_PROFILE in ENCODER_PROFILES:
+            return ENCODER_PROFILE
+        log(f"WARNING: Unknown encoder profile '{ENCODER_PROFILE}', using 'fast'")
+        return "fast"
+    try:
+        with open(CALIBRATION_FILE, encoding="utf-8") as f:
+            profile = json.load(f).get("profile")
+        if profile in ENCODER_PROFILES:
+            return profile
+    except (OSError, ValueError):
+        pass
+    return "fast"
+
+def source_video_bitrate(path, track=None):
+    """Average video bitrate of an MP4 (bits/s) from its sample table, or None"""
+    track = track or read_mp4_track(path)
+    if track and track.duration > 0:
+        return int(sum(track.sample_sizes) * 8 / track.duration)
+    return None
+
+def renderer():
+    if RENDERER in RENDERERS:
+        return RENDERER
+    log(f"WARNING: Unknown renderer '{RENDERER}', using 'drawtext'")
+    return "drawtext"
+
+def _ass_time(seconds):
+    cs = int(round(seconds * 100))
+    return f"{cs // 360000}:{cs // 6000 % 60:02d}:{cs // 100 % 60:02d}.{cs % 100:02d}"
+
+def write_ass_overlay(f, cam, date_display, ts_start, duration, width, height, combined=False, timeline=None):
+    """Write the overlay as an ASS script with one clock cue per second of the clip.
+
+    Lines are placed where the drawtext renderer puts them (x=20, 180/120/60
+    pixels above the bottom). combined=True writes a single three-line cue
+    per second instead, since soft subtitle tracks can't hold overlapping cues.
+    """
+    h, m, s = map(int, ts_start.split(':'))
+    timeline = timeline or Timeline.linear(h * 3600 + m * 60 + s)
+    # ASS has no escape for braces (override blocks), so keep names literal-safe
+    cam, date_display = (t.replace("\\", "/").replace("{", "(").replace("}", ")") for t in (cam, date_display))
+
+    f.write(f"[Script Info]\nScriptType: v4.00+\nPlayResX: {width}\nPlayResY: {height}\n"
+            f"WrapStyle: 2\nScaledBorderAndShadow: yes\n\n")
+    f.write("[V4+ Styles]\n"
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+            "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+            "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n"
+            "Style: Overlay,Arial,48,&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,"
+            "0,0,0,0,100,100,0,0,1,4,0,7,20,20,20,1\n\n")
+    f.write("[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n")
+
+    end = max(1, int(duration + 0.999))
+    if not combined:
+        for text, rise in ((cam, 180), (date_display, 120)):
+            f.write(f"Dialogue: 0,{_ass_time(0)},{_ass_time(end)},Overlay,,0,0,0,,{{\\pos(20,{height - rise})}}{text}\n")
+    for start, stop, clock in timeline.cues(end):
+        if _ass_time(start) == _ass_time(stop):
+            continue  # Shorter than the script's time resolution
+        clock %= 86400
+        clock = f"{clock // 3600:02d}:{clock // 60 % 60:02d}:{clock % 60:02d}"
+        if combined:
+            text = f"{{\\pos(20,{height - 180})}}{cam}\\N{date_display}\\N{clock}"
+        else:
+            text = f"{{\\pos(20,{height - 60})}}{clock}"
+        f.write(f"Dialogue: 0,{_ass_time(start)},{_ass_time(stop)},Overlay,,0,0,0,,{text}\n")
+
+def _filter_path(path):
+    """Escape a file path for use as an unquoted filter option value.
+
+    The path is escaped twice: once for the option value (\\ ' :) and once
+    for the filtergraph around it (\\ ' [ ] , ;).
+    """
+    value = re.sub(r"([\\':])", r"\\\1", str(path).replace("\\", "/"))
+    return re.sub(r"([\\'\[\],;])", r"\\\1", value)
+
+def prepare_overlay(path, cam, date_display, ts_start, timeline=None, track=None):
+    """Video filter for the overlay with the configured renderer.
+
+    Returns (vf, subs): subs is the generated ASS file, which the caller
+    deletes, or None for drawtext. vf is None for the soft renderer, whose
+    subs are muxed as a subtitle track rather than burned in. track is the
+    file's Mp4Track if the caller has parsed it already.
+    """
+    kind = renderer()
+    if kind == "drawtext" and timeline is not None and len(timeline.starts) > DRAWTEXT_MAX_SEGMENTS:
+        log(f"Clock has {len(timeline.starts)} segments, too many for drawtext - using the ass renderer")
+        kind = "ass"
+    if track is None and (kind != "drawtext" or STATIC_TEXT_LAYER):
+        track = read_mp4_track(path)
+    if kind != "drawtext":
+        if track is None or not track.duration or not track.height:
+            log(f"WARNING: Clip duration or size unknown, using the drawtext renderer")
+            kind = "drawtext"
+    if kind == "drawtext":
+        width = track.width if track else None
+        return render_filter(build_overlay_filter(cam, date_display, ts_start, timeline, width)), None
+
+    # In band mode the subtitles are drawn on the cropped strip, so lay them out for its height
+    height = BAND_HEIGHT if kind == "ass" and render_mode() == "band" else track.height
+    with tempfile.NamedTemporaryFile("w", suffix=".ass", delete=False, encoding="utf-8") as f:
+        write_ass_overlay(f, cam, date_display, ts_start, track.duration, track.width, height,
+                          combined=kind == "soft", timeline=timeline)
+    subs = Path(f.name)
+    log(f"Generated {int(track.duration + 0.999)} clock cues in {subs.name}")
+    if kind == "soft":
+        return None, subs
+    return render_filter(f"ass=filename={_filter_path(subs)}"), subs
+
+def render_mode():
+    """OVERLAY_RENDER_MODE, except that band falls back to full until --compare-modes approves it"""
+    if RENDER_MODE not in RENDER_MODES:
+        log(f"WARNING: Unknown render mode '{RENDER_MODE}', using 'full'")
+        return "full"
+    if RENDER_MODE == "band" and not band_approved():
+        return "full"
+    return RENDER_MODE
+
+def band_approved():
+    """Whether the last --compare-modes run found band mode faster than full at the same quality"""
+    try:
+        with open(RENDER_MODES_FILE, encoding="utf-8") as f:
+            return json.load(f).get("use_band") is True
+    except (OSError, ValueError):
+        return False
+
+def render_filter(vf, mode=None):
+    """Wrap the drawtext chain for the render mode (see RENDER_MODES)"""
+    if (mode or render_mode()) != "band":
+        return vf
+    # drawtext positions are relative to main_h, so they land on the same rows of the strip
+    b = BAND_HEIGHT
+    if "[in]" in vf:
+        # Graph with a static text layer: its main input is the cropped strip
+        band = f"[strip]crop=iw:{b}:0:ih-{b}[cropped];{vf.replace('[in]', '[cropped]')}[band]"
+    else:
+        band = f"[strip]crop=iw:{b}:0:ih-{b},{vf}[band]"
+    return (f"split=2[base][strip];{band};"
+            f"[base][band]overlay=0:main_h-{b}:format=auto,addroi=x=0:y=ih-{b}:w=iw:h={b}:qoffset={BAND_QOFFSET}")
+
+def encoder_args(path, profile=None, mode=None, codec=None, track=None):
+    """ffmpeg output arguments for the given (or default) encoder profile and render mode.
+
+    HEVC sources (codec is detected if not given) use HEVC_ENCODER_PROFILES
+    unless HEVC_OUTPUT is off. track is the source's Mp4Track, if parsed.
+    """
+    profile = profile or default_encoder_profile()
+    mode = mode or render_mode()
+    hevc = HEVC_OUTPUT and (codec or video_codec(path, track=track)) == "hevc"
+    args = list((HEVC_ENCODER_PROFILES if hevc else ENCODER_PROFILES)[profile])
+    x264_params = []
+    if profile == "match":
+        bitrate = source_video_bitrate(path, track) if path else None
+        if bitrate:
+            args += ["-b:v", str(bitrate), "-maxrate", str(bitrate * 3 // 2), "-bufsize", str(bitrate * 2)]
+        else:
+            crf = "28" if hevc else "23"
+            log(f"  Source bitrate unknown, using CRF {crf} for the 'match' profile")
+            args += ["-crf", crf]
+    if mode == "band":
+        x264_params.append("aq-mode=1")  # ROI offsets are ignored without adaptive quantization (x264 and x265)
+    if ENCODER_THREADS > 0:
+        args += ["-threads", str(ENCODER_THREADS)]
+    if ENCODER_SLICES > 0:
+        x264_params.append(f"slices={ENCODER_SLICES}")
+    if x264_params:
+        args += ["-x265-params" if hevc else "-x264-params", ":".join(x264_params)]
+    return args + AUDIO_ARGS
+
+def quality_check(source, output, duration=None, startupinfo=None):
+    """PSNR (dB) and SSIM of output against source, above the overlay band.
+
+    Only the picture the overlay doesn't touch is compared, so the numbers
+    show what the encode cost rather than the text itself. Returns
+    (psnr, ssim); either is None if ffmpeg didn't report it.
+    """
+    b = BAND_HEIGHT
+    limit = ["-t", str(duration)] if duration else []
+    graph = (f"[0:v]crop=iw:ih-{b}:0:0,split[o1][o2];[1:v]crop=iw:ih-{b}:0:0,split[s1][s2];"
+             f"[o1][s1]psnr;[o2][s2]ssim")
+    cmd = [FFMPEG_PATH] + limit + ["-i", str(output)] + limit + ["-i", str(source),
+           "-lavfi", graph, "-f", "null", "-"]
+    _, stderr = _run_ffmpeg(cmd, startupinfo=startupinfo)
+    psnr = re.search(rb'PSNR .*?average:(inf|[\d.]+)', stderr)
+    ssim = re.search(rb'SSIM .*?All:([\d.]+)', stderr)
+    return (float(psnr.group(1)) if psnr else None,
+            float(ssim.group(1)) if ssim else None)
+
+def calibration_sample(videos):
+    """Largest clip of the batch (most representative of the heavy files) and its overlay filter"""
+    sample = max(videos, key=lambda v: v.stat().st_size)
+    cam, ts_start, _ = read_mp4_sei(sample)
+    track = read_mp4_track(sample)
+    vf = build_overlay_filter(cam or "NO CAMERA NAME", date_from_filename(sample), ts_start or "00:00:00",
+                              width=track.width if track else None)
+    return sample, vf
+
+def encode_sample(sample, vf, out, profile=None, mode=None):
+    """Encode the first CALIBRATE_SECONDS of sample. Returns (fps, bytes) or None on failure."""
+    cmd = ([FFMPEG_PATH, "-t", str(CALIBRATE_SECONDS), "-i", str(sample), "-vf", render_filter(vf, mode)] +
+           encoder_args(sample, profile, mode) + ["-an", "-y", str(out)])
+    start = time.time()
+    returncode, stderr = _run_ffmpeg(cmd)
+    elapsed = time.time() - start
+    frames = re.findall(rb'frame=\s*(\d+)', stderr)
+    if returncode != 0 or not frames:
+        log(f"  Encode failed: {stderr.decode(errors='ignore').strip().splitlines()[-1:]}")
+        return None
+    fps = int(frames[-1]) / elapsed if elapsed > 0 else 0.0
+    return fps, out.stat().st_size
+
+def calibrate(videos, target_fps=None):
+    """Encode a short sample from the batch with every profile and pick one.
+
+    The chosen profile is the smallest output among those reaching the
+    target encode speed (frames per second), or the fastest if none do. The
+    results are saved to CALIBRATION_FILE and used by later runs.
+    """
+    target_fps = TARGET_FPS if target_fps is None else target_fps
+    sample, vf = calibration_sample(videos)
+    log(f"Calibrating encoder profiles on the first {CALIBRATE_SECONDS:g}s of {sample.name} (target {target_fps:g} fps)")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ENCODER_PROFILES:
+            encoded = encode_sample(sample, vf, Path(tmp) / f"{profile}.mp4", profile)
+            if encoded is None:
+                continue
+            fps, size = encoded
+            results.append({"profile": profile, "fps": round(fps, 1), "bytes": size,
+                            "bytes_per_second": int(size / CALIBRATE_SECONDS)})
+            log(f"  {profile:<6} {fps:7.1f} fps  {size / 1048576:7.2f} MiB")
+
+    if not results:
+        log("Calibration failed - keeping the current encoder profile")
+        return None
+    fast_enough = [r for r in results if r["fps"] >= target_fps]
+    best = min(fast_enough, key=lambda r: r["bytes"]) if fast_enough else max(results, key=lambda r: r["fps"])
+    if not fast_enough:
+        log(f"  No profile reached {target_fps:g} fps, choosing the fastest")
+    try:
+        with open(CALIBRATION_FILE, "w", encoding="utf-8") as f:
+            json.dump({"profile": best["profile"], "target_fps": target_fps, "sample": str(sample),
+                       "cpu_count": CPU_COUNT, "date": time.strftime('%Y-%m-%d %H:%M:%S'),
+                       "results": results}, f, indent=2)
+    except OSError as e:
+        log(f"WARNING: Could not save calibration to {CALIBRATION_FILE}: {e}")
+    log(f"Selected encoder profile: {best['profile']}")
+    return best["profile"]
+
+def compare_render_modes(videos):
+    """Encode a sample from the batch in every render mode and report speed, size and quality"""
+    sample, vf = calibration_sample(videos)
+    profile = default_encoder_profile()
+    log(f"Comparing render modes on the first {CALIBRATE_SECONDS:g}s of {sample.name} (profile {profile})")
+    baseline = None
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in RENDER_MODES:
+            out = Path(tmp) / f"{mode}.mp4"
+            encoded = encode_sample(sample, vf, out, profile, mode)
+            if encoded is None:
+                continue
+            fps, size = encoded
+            baseline = baseline or fps
+            psnr, ssim = quality_check(sample, out, CALIBRATE_SECONDS)
+            results[mode] = {"fps": round(fps, 1), "bytes": size, "psnr": psnr, "ssim": ssim}
+            log(f"  {mode:<5} {fps:7.1f} fps ({fps / baseline:4.2f}x)  {size / 1048576:7.2f} MiB  "
+                f"PSNR {psnr if psnr is not None else '?'} dB  SSIM {ssim if ssim is not None else '?'} (above the band)")
+
+    if len(results) < len(RENDER_MODES):
+        log("Comparison incomplete - band mode stays off")
+        return
+    band, full = results["band"], results["full"]
+    faster = band["fps"] > full["fps"]
+    # Without a PSNR for both there's no evidence the footage above the band is unharmed
+    kept_quality = (band["psnr"] is not None and full["psnr"] is not None
+                    and band["psnr"] >= full["psnr"] - BAND_MAX_PSNR_LOSS)
+    use_band = faster and kept_quality
+    try:
+        with open(RENDER_MODES_FILE, "w", encoding="utf-8") as f:
+            json.dump({"use_band": use_band, "profile": profile, "sample": str(sample),
+                       "cpu_count": CPU_COUNT, "date": time.strftime('%Y-%m-%d %H:%M:%S'),
+                       "results": results}, f, indent=2)
+    except OSError as e:
+        log(f"WARNING: Could not save the comparison to {RENDER_MODES_FILE}: {e}")
+    if use_band:
+        log("Band mode is faster here at the same quality - OVERLAY_RENDER_MODE=band will use it")
+    else:
+        log(f"Band mode is {'not faster here' if not faster else 'faster but loses quality above the band'} - "
+            f"OVERLAY_RENDER_MODE=band will encode in full mode")
+
+def mosaic_layout(count):
+    """(columns, rows) of the most square grid with room for count tiles"""
+    columns = math.ceil(math.sqrt(count))
+    return columns, math.ceil(count / columns)
+
+def burn_mosaic(videos, window=None):
+    """Tile the cameras in videos, time-aligned, into one video with an overlay per tile.
+
+    window is "HH:MM:SS-HH:MM:SS" on the recorders' clock; by default the
+    mosaic runs from the earliest clip start to the latest clip end. The
+    output goes to with_overlay/ next to the first clip. Returns the path
+    written, or None.
+    """
+    log(f"Probing {len(videos)} clip(s) for the mosaic")
+    with ThreadPoolExecutor(max_workers=PROBE_CONCURRENCY) as pool:
+        probed = list(zip(videos, pool.map(probe, videos)))
+
+    clips = {}  # Camera -> [(start clock, duration, path, metadata)]
+    for path, metadata in probed:
+        if not metadata.start_time or not metadata.duration:
+            log(f"WARNING: {path.name} has no metadata or duration, leaving it out of the mosaic")
+            continue
+        h, m, sec = map(int, metadata.start_time.split(':'))
+        start = metadata.timeline.offsets[0] if metadata.timeline else h * 3600 + m * 60 + sec
+        camera = metadata.camera or path.stem.split('-')[0]
+        clips.setdefault(camera, []).append((start, metadata.duration, path, metadata))
+    if len(clips) < 2:
+        log(f"ERROR: A mosaic needs clips from at least 2 cameras, found {len(clips)}")
+        return None
+    dates = {metadata.date_display for _, metadata in probed if metadata.start_time}
+    if len(dates) > 1:
+        log(f"WARNING: Clips are from different dates ({', '.join(sorted(dates))}); they are aligned by time of day only")
+
+    if window:
+        match = re.fullmatch(r'(\d{1,2}):(\d\d):(\d\d)-(\d{1,2}):(\d\d):(\d\d)', window.strip())
+        if not match:
+            log(f"ERROR: Window '{window}' is not HH:MM:SS-HH:MM:SS")
+            return None
+        h1, m1, s1, h2, m2, s2 = map(int, match.groups())
+        origin, end = h1 * 3600 + m1 * 60 + s1, h2 * 3600 + m2 * 60 + s2
+    else:
+        origin = min(start for camera in clips.values() for start, _, _, _ in camera)
+        end = max(start + duration for camera in clips.values() for start, duration, _, _ in camera)
+    for camera in list(clips):
+        clips[camera] = sorted(c for c in clips[camera] if c[0] < end and c[0] + c[1] > origin)
+        if not clips[camera]:
+            del clips[camera]
+    if len(clips) < 2 or end <= origin:
+        log(f"ERROR: Fewer than 2 cameras have video in the window {window}" if window
+            else "ERROR: Fewer than 2 cameras have video to tile")
+        return None
+
+    tracks = [read_mp4_track(path) for camera in clips.values() for _, _, path, _ in camera]
+    first = next((track for track in tracks if track and track.height), None)
+    fps = max((round(track.sample_count / track.duration) for track in tracks if track and track.duration), default=25)
+    columns, rows = mosaic_layout(len(clips))
+    tile_w = MOSAIC_WIDTH // columns // 2 * 2
+    tile_h = round(tile_w * (first.height / first.width if first else 9 / 16) / 2) * 2
+    tile_chain = (f"scale={tile_w}:{tile_h}:force_original_aspect_ratio=decrease,"
+                  f"pad={tile_w}:{tile_h}:(ow-iw)/2:(oh-ih)/2,setsar=1,setpts=PTS-STARTPTS,fps={fps}")
+    # The overlay is drawn on the scaled tile: full-size text from 540 rows
+    # up, smaller below that so the three rows still fit a 4x4 grid
+    text_scale = min(1.0, tile_h / 540)
+
+    inputs, graph, tiles = [], [], []
+    input_count = 0
+    for n, (camera, camera_clips) in enumerate(clips.items()):
+        cursor, parts = origin, []  # parts: [(filter chain, tpad options)]
+        for start, duration, path, metadata in camera_clips:
+            if parts and start < cursor - 0.5:
+                log(f"WARNING: {path.name} overlaps the previous clip of {camera}, leaving it out")
+                continue
+            skip = max(0.0, origin - start)
+            timeline = (metadata.timeline or Timeline.linear(start)).shifted(skip)
+            overlay = build_overlay_filter(camera, metadata.date_display, metadata.start_time, timeline,
+                                           scale=text_scale)
+            if skip:
+                inputs += ["-ss", f"{skip:.3f}"]
+            inputs += ["-i", str(path)]
+            input_count += 1
+            gap = start + skip - cursor
+            parts.append((f"[{input_count - 1}:v]{tile_chain},{overlay}",
+                          [f"start_duration={gap:.3f}"] if gap > 0.001 else []))
+            cursor = start + duration
+        if end - cursor > 0.001:
+            parts[-1][1].append(f"stop_duration={end - cursor:.3f}")  # Black until the mosaic ends
+        labels = [f"[tile{n}]"] if len(parts) == 1 else [f"[c{n}_{k}]" for k in range(len(parts))]
+        for (chain, pad), label in zip(parts, labels):
+            graph.append(chain + (f",tpad={':'.join(pad)}:color=black" if pad else "") + label)
+        if len(parts) > 1:
+            graph.append(f"{''.join(labels)}concat=n={len(parts)}:v=1:a=0[tile{n}]")
+        tiles.append(f"[tile{n}]")
+    layout = "|".join(f"{(n % columns) * tile_w}_{(n // columns) * tile_h}" for n in range(len(tiles)))
+    graph.append(f"{''.join(tiles)}xstack=inputs={len(tiles)}:layout={layout}:fill=black[mosaic]")
+
+    span = f"{time.strftime('%H%M%S', time.gmtime(origin))}-{time.strftime('%H%M%S', time.gmtime(end))}"
+    out = videos[0].parent / "with_overlay" / f"mosaic_{span}_{len(tiles)}cams.mp4"
+    out.parent.mkdir(exist_ok=True)
+    part = out.with_name(out.name + ".part")
+    cmd = ([FFMPEG_PATH] + inputs + ["-filter_complex", ";".join(graph), "-map", "[mosaic]", "-t", f"{end - origin:.3f}"]
+           + encoder_args(None, mode="full", codec="h264") + ["-an", "-f", "mp4", "-y", str(part)])
+    log(f"Mosaic of {len(tiles)} camera(s) in a {columns}x{rows} grid of {tile_w}x{tile_h} tiles at {fps} fps, "
+        f"{time.strftime('%H:%M:%S', time.gmtime(origin))} to {time.strftime('%H:%M:%S', time.gmtime(end))}")
+    log(f"FFmpeg command: {' '.join(cmd)}")
+
+    reported = [0]
+    def on_progress(report):
+        try:
+            done = int(int(report.get('out_time_us', 0)) / 1e6 * 10 / (end - origin))
+        except ValueError:
+            return
+        if done > reported[0]:
+            reported[0] = done
+            log(f"  Mosaic {min(done, 10) * 10}% encoded")
+    start_time = time.time()
+    returncode, stderr = _run_ffmpeg(cmd, startupinfo=hidden_console(), on_progress=on_progress)
+    if returncode != 0:
+        log(f"FFmpeg error (full output):")
+        log(stderr.decode(errors='ignore'))
+        part.unlink(missing_ok=True)
+        return None
+    commit_output(part, out)
+    log(f"Created: {out.name} in {out.parent.name}/ (took {time.time() - start_time:.1f}s)")
+    return out
+
+def burn_single_pass(path, out, date_display, startupinfo=None, on_progress=None, codec=None, track=None):
+    """Probe and burn with a single read of the source file.
+
+    One ffmpeg demuxes the file once and remuxes it (stream copy, video in
+    Annex B form) into NUT on stdout, which burn_demuxed() scans and encodes.
+    Returns (returncode, stderr, camera, start_time, bytes_read); camera and
+    start_time are None if no metadata was found. on_progress is called with
+    the share of the source that has been fed to the encoder. track is the
+    source's Mp4Track, if parsed.
+    """
+    source_size = path.stat().st_size or 1
+    track = track or read_mp4_track(path)
+    codec = codec or video_codec(path, startupinfo, track)
+    demux = subprocess.Popen(
+        [FFMPEG_PATH, "-i", str(path), "-map", "0:v:0", "-map", "0:a?", "-c", "copy",
+         "-bsf:v", CODECS[codec]["bsf"], "-f", "nut", "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, startupinfo=startupinfo
+    )
+
+    def overlay(cam, ts_start):
+        vf, subs = prepare_overlay(path, cam, date_display, ts_start, track=track)
+        if vf is None:  # Soft subtitles need the metadata before muxing; burn with drawtext here
+            vf = render_filter(build_overlay_filter(cam, date_display, ts_start, width=track.width if track else None))
+        return vf, subs
+
+    fed = (lambda nbytes: on_progress({}, fraction=min(1.0, nbytes / source_size))) if on_progress else None
+    return burn_demuxed(demux, overlay, encoder_args(path, codec=codec, track=track) + ["-f", "mp4", "-y", str(out)],
+                        date_display, codec, startupinfo=startupinfo, on_fed=fed)
+
+def burn_demuxed(demux, overlay, output_args, date_display, codec, startupinfo=None, stdout=subprocess.DEVNULL, on_fed=None):
+    """Scan a demuxer's NUT output for the metadata, then encode it with the overlay.
+
+    demux is a running ffmpeg writing NUT (video in Annex B form) to its
+    stdout. The copied bitstream is scanned for the SEI metadata while it is
+    held in memory; once found (or the probe byte budget is used up)
+    overlay(camera, start_time) gives (vf, subs) and the encoder is started
+    with output_args and fed the held data followed by the rest of the
+    stream. The encoder's stdout goes to stdout. on_fed is called with the
+    number of bytes fed so far. Returns (returncode, stderr, camera,
+    start_time, bytes_read); demux is stopped and reaped either way.
+    """
+    encoder = subs = None
+    with progress_lock:
+        _active_procs.add(demux)
+    try:
+        scanner = SeiScanner(codec=codec)
+        held = []
+        while scanner.camera is None and (PROBE_MAX_BYTES <= 0 or scanner.bytes_scanned < PROBE_MAX_BYTES):
+            data = demux.stdout.read(1048576)
+            if not data:
+                break
+            _probe_reads.consume(len(data))
+            held.append(data)
+            scanner.feed(data)
+        log(f"Single-pass probe scanned {scanner.bytes_scanned} bytes of the copied stream before encoding")
+        cam = scanner.camera or "NO CAMERA NAME"
+        ts_start = scanner.start_time or "00:00:00"
+        log(f"Camera: {cam}, Date: {date_display}, Start time: {ts_start}")
+
+        vf, subs = overlay(cam, ts_start)
+        cmd = [FFMPEG_PATH, "-f", "nut", "-i", "-", "-vf", vf] + output_args
+        log(f"FFmpeg command: {' '.join(cmd)}")
+
+        # stderr goes to a temp file so a chatty encoder can't block while we feed stdin
+        with tempfile.TemporaryFile() as err_file:
+            encoder = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=stdout,
+                                       stderr=err_file, startupinfo=startupinfo)
+            with progress_lock:
+                _active_procs.add(encoder)
+            bytes_read = scanner.bytes_scanned
+            try:
+                for data in held:
+                    encoder.stdin.write(data)
+                held = None
+                while True:
+                    data = demux.stdout.read(1048576)
+                    if not data:
+                        break
+                    bytes_read += len(data)
+                    encoder.stdin.write(data)
+                    if on_fed:
+                        on_fed(bytes_read)
+            except BrokenPipeError:
+                pass  # Encoder exited early - its stderr explains why
+            finally:
+                try:
+                    encoder.stdin.close()
+                except BrokenPipeError:
+                    pass
+            encoder.wait()
+            err_file.seek(0)
+            stderr = err_file.read()
+        return encoder.returncode, stderr, scanner.camera, scanner.start_time, bytes_read
+    finally:
+        if demux.poll() is None:
+            demux.kill()
+        demux.stdout.close()
+        demux.wait()
+        if subs:
+            subs.unlink(missing_ok=True)
+        with progress_lock:
+            _active_procs.discard(demux)
+            _active_procs.discard(encoder)
+
+def stream_codec(head):
+    """Video codec of a piped clip from its first bytes; None if more are needed.
+
+    Raises ValueError for an MP4 whose moov box comes after its media data,
+    which can't be demuxed without seeking.
+    """
+    if head[4:8] == b'ftyp':
+        pos = 0
+        while pos + 8 <= len(head):
+            size, box_type = struct.unpack_from('>I4s', head, pos)
+            header = 8
+            if size == 1:  # 64-bit size after the type
+                if pos + 16 > len(head):
+                    return None
+                size = struct.unpack_from('>Q', head, pos + 8)[0]
+                header = 16
+            if size != 0 and size < header:
+                raise ValueError(f"malformed '{box_type.decode('latin-1')}' box at offset {pos}")
+            if box_type == b'mdat':
+                raise ValueError("the MP4 has its moov box after the media data; pipe it as fragmented MP4 "
+                                 "or remux it with -movflags +faststart")
+            if box_type == b'moov':
+                if size == 0:
+                    # Runs to the end of the stream, so decide once a sample entry has arrived
+                    moov = head[pos:]
+                    if not any(entry in moov for entry in (b'avc1', b'avc3', b'hvc1', b'hev1')):
+                        return None
+                elif pos + size > len(head):
+                    return None
+                else:
+                    moov = head[pos:pos + size]
+                return "hevc" if b'hvc1' in moov or b'hev1' in moov else "h264"
+            if size == 0:  # Box to the end of the stream: no moov follows
+                raise ValueError(f"the MP4 has no moov box before its '{box_type.decode('latin-1')}' box "
+                                 f"runs to the end")
+            pos += size
+        return None
+    start = head.find(b'\x00\x00\x01')
+    if start < 0 or start + 5 > len(head):
+        return None
+    nal_type, layer = (head[start + 3] >> 1) & 0x3f, head[start + 4]
+    return "hevc" if layer == 1 and nal_type in (32, 33, 34, 35, 39) else "h264"
+
+def burn_stream(source, name=None, startupinfo=None):
+    """Burn the clip read from source (stdin's binary buffer or an open named pipe) onto stdout.
+
+    name is the clip's original file name, used for the date; the output is
+    fragmented MP4 so it can be written without seeking. Returns ffmpeg's
+    exit code.
+    """
+    head = b""
+    codec = None
+    while codec is None and len(head) < STREAM_HEAD_BYTES:
+        data = source.read(1048576)
+        if not data:
+            break
+        head += data
+        try:
+            codec = stream_codec(head)
+        except ValueError as e:
+            log(f"ERROR: Can't stream this input: {e}")
+            return 1
+    if not head:
+        log("ERROR: No input on the stream")
+        return 1
+    codec = codec or "h264"
+    date_display = date_from_filename(Path(name)) if name else "Unknown Date"
+    log(f"Streaming {codec} input{f' ({name})' if name else ''}")
+
+    demux = subprocess.Popen(
+        [FFMPEG_PATH, "-i", "pipe:0", "-map", "0:v:0", "-map", "0:a?", "-c", "copy",
+         "-bsf:v", CODECS[codec]["bsf"], "-f", "nut", "-"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, startupinfo=startupinfo
+    )
+
+    def feed():
+        try:
+            demux.stdin.write(head)
+            while True:
+                data = source.read(1048576)
+                if not data:
+                    break
+                demux.stdin.write(data)
+        except (BrokenPipeError, ValueError):
+            pass  # Demuxer gone; burn_demuxed() reports the failure
+        finally:
+            try:
+                demux.stdin.close()
+            except BrokenPipeError:
+                pass
+    threading.Thread(target=feed, name="stream-feed", daemon=True).start()
+
+    def overlay(cam, ts_start):
+        # No clip length or frame size before the stream has been read: always drawtext
+        return render_filter(build_overlay_filter(cam, date_display, ts_start)), None
+
+    sys.stdout.flush()
+    returncode, stderr, _, _, bytes_read = burn_demuxed(
+        demux, overlay, encoder_args(None, codec=codec) + ["-movflags", STREAM_MOVFLAGS, "-f", "mp4", "-"],
+        date_display, codec, startupinfo=startupinfo, stdout=sys.stdout.fileno())
+    if returncode != 0:
+        log(f"FFmpeg error (full output):")
+        log(stderr.decode(errors='ignore'))
+    else:
+        log(f"Streamed {bytes_read} bytes of the copied source through the encoder")
+    return returncode
+
+def plan_segments(path, count=None, track=None):
+    """Keyframe-aligned segments for a parallel encode, or None to encode the clip whole.
+
+    The clip is cut at the keyframe nearest each 1/count of its duration.
+    Returns ([(start_seconds, frame_count), ...], frame_duration).
+    """
+    count = SEGMENTS if count is None else count
+    if count < 2:
+        return None
+    track = track or read_mp4_track(path)
+    if track is None or not track.sample_count or track.duration < SEGMENT_MIN_DURATION:
+        return None
+    keyframes = [(index, pts) for index, _, _, pts in track.iter_keyframes()]
+    if not keyframes or keyframes[0][0] != 0:
+        return None
+    times = [pts for _, pts in keyframes]
+    cuts = [0]
+    for k in range(1, count):
+        target = track.duration * k / count
+        i = bisect.bisect_left(times, target)
+        i = min((j for j in (i - 1, i) if 0 <= j < len(times)), key=lambda j: abs(times[j] - target))
+        if i > cuts[-1]:
+            cuts.append(i)
+    if len(cuts) < 2:
+        return None
+    bounds = [keyframes[i][0] for i in cuts] + [track.sample_count]
+    segments = [(times[i], bounds[n + 1] - bounds[n]) for n, i in enumerate(cuts)]
+    return segments, track.duration / track.sample_count
+
+def verify_segmented(path, out, segments, frame_duration, track=None):
+    """Check a joined segmented encode against its source. Returns None if it's good, else the problem.
+
+    The output must have exactly the source's frames, and each segment must
+    start at its keyframe's time with no gap or overlap at the join. The
+    rendered clock at the joins is checked by the benchmark suite.
+    """
+    source, joined = track or read_mp4_track(path), read_mp4_track(out)
+    if source is None or joined is None:
+        return "can't read the sample tables"
+    if joined.sample_count != source.sample_count:
+        return f"{joined.sample_count} frames, source has {source.sample_count}"
+    times = sorted(joined.iter_sample_times())
+    first = 0
+    for n, (start, frames) in enumerate(segments):
+        if abs(times[first] - start) > frame_duration / 2:
+            return f"segment {n + 1} starts at {times[first]:.3f}s, expected {start:.3f}s"
+        first += frames
+    return None
+
+def burn_segmented(path, out, plan, overlay, timeline, startupinfo=None, on_progress=None, profile=None, track=None):
+    """Encode path as keyframe-aligned segments in parallel and join them into out.
+
+    plan comes from plan_segments(). overlay(timeline) returns (vf, subs) for
+    a segment whose clock is given by timeline, as prepare_overlay() does.
+    Every segment is decoded from its keyframe and its overlay is shifted by
+    its seek point, so the joined clock runs on as if encoded whole. The
+    audio is copied from the source when the segments are joined. track is
+    the source's Mp4Track, if parsed. Returns (returncode, stderr) like
+    _run_ffmpeg; -1 if the joined file fails verify_segmented().
+    """
+    segments, frame_duration = plan
+    duration = sum(frames for _, frames in segments) * frame_duration
+    threads = ENCODER_THREADS or max(1, CPU_COUNT // len(segments))
+    # Seeking half a frame early lands on the keyframe itself, not the one
+    # before it; the keyframe then reaches the filters at t = start - seek,
+    # so each segment's clock is shifted by its seek point
+    seeks = [max(0.0, start - frame_duration / 2) for start, _ in segments]
+    seg_timelines = [timeline.shifted(seek) for seek in seeks]
+    encoded = [0.0] * len(segments)
+    log(f"  Encoding in {len(segments)} segments at " + ", ".join(f"{start:.1f}s" for start, _ in segments))
+
+    with tempfile.TemporaryDirectory(prefix=f".{path.stem}-segments-", dir=out.parent) as tmp:
+        parts = [Path(tmp) / f"{n:03d}.mp4" for n in range(len(segments))]
+
+        def encode(n):
+            frames = segments[n][1]
+            def report(progress):
+                try:
+                    encoded[n] = int(progress.get('out_time_us', 0)) / 1e6
+                except ValueError:
+                    return
+                on_progress(progress, fraction=min(1.0, sum(encoded) / duration))
+            vf, subs = overlay(seg_timelines[n])
+            try:
+                cmd = ([FFMPEG_PATH, "-ss", f"{seeks[n]:.6f}", "-i", str(path),
+                        "-map", "0:v:0", "-frames:v", str(frames), "-vf", vf] + encoder_args(path, profile, track=track) +
+                       ["-threads", str(threads), "-an", "-y", str(parts[n])])
+                return _run_ffmpeg(cmd, startupinfo=startupinfo, on_progress=report if on_progress else None)
+            finally:
+                if subs:
+                    subs.unlink(missing_ok=True)
+
+        with ThreadPoolExecutor(max_workers=len(segments)) as pool:
+            results = list(pool.map(encode, range(len(segments))))
+        for returncode, stderr in results:
+            if returncode != 0:
+                return returncode, stderr
+
+        concat_list = Path(tmp) / "segments.txt"
+        concat_list.write_text("".join("file '{}'\n".format(str(part).replace("'", "'\\''")) for part in parts),
+                               encoding="utf-8")
+        cmd = [FFMPEG_PATH, "-f", "concat", "-safe", "0", "-i", str(concat_list), "-i", str(path),
+               "-map", "0:v", "-map", "1:a?", "-c", "copy", "-strict", "-2", "-f", "mp4", "-y", str(out)]
+        returncode, stderr = _run_ffmpeg(cmd, startupinfo=startupinfo)
+    if returncode != 0:
+        return returncode, stderr
+    problem = verify_segmented(path, out, segments, frame_duration, track)
+    if problem:
+        log(f"  Segmented output failed verification: {problem}")
+        return -1, problem.encode()
+    log(f"  Segmented output verified: {sum(frames for _, frames in segments)} frames, "
+        f"every segment starting at its keyframe")
+    return 0, b""
+
+def commit_output(part, out):
+    """Flush a finished .part file to disk and rename it to out in one step"""
+    with open(part, 'r+b') as f:
+        os.fsync(f.fileno())
+    os.replace(part, out)
+
+def hidden_console():
+    """startupinfo that keeps ffmpeg's console window hidden on Windows; None elsewhere"""
+    if platform.system() != 'Windows':
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return startupinfo
+
+def read_metadata(path, codec, startupinfo=None, pipe=True, track=None):
+    """Run the probe chain on path: sample table, then mapped scan, then the ffmpeg pipe.
+
+    Returns (camera, start_time, timeline, bytes_read); camera and
+    start_time are None if no metadata was found. pipe=False leaves out the
+    ffmpeg probe, for callers that scan the stream themselves. track is the
+    file's Mp4Track if the caller has parsed it already.
+    """
+    cam = ts_start = timeline = None
+    bytes_read = 0
+    if NATIVE_PROBE:
+        cam, ts_start, bytes_read = read_mp4_sei(path, track=track)
+    if not ts_start and MMAP_PROBE and is_local_file(path):
+        cam, ts_start, bytes_read = scan_mapped_sei(path)
+    if not ts_start and pipe:
+        cam, ts_start, bytes_read = probe_sei(path, startupinfo=startupinfo, codec=codec)
+    if ts_start and USE_TIMELINE:
+        # Whichever probe found the first record, the sample table knows when
+        # each record is shown - the first may come seconds into the clip
+        timeline = read_mp4_timeline(path, track)
+        if timeline is not None:
+            ts_start = time.strftime('%H:%M:%S', time.gmtime(timeline.clock_at(0.0) % 86400))
+            if timeline.starts[0] > 0:
+                log(f"  First metadata record at {timeline.starts[0]:.2f}s, clock at the first frame: {ts_start}")
+    return cam, ts_start, timeline, bytes_read
+
+def overlay_command(path, out, vf, subs, codec=None, profile=None, track=None):
+    """The ffmpeg command that burns vf into path (or, for soft subtitles, muxes subs) and writes out as MP4"""
+    if vf is None:
+        return [FFMPEG_PATH, "-i", str(path), "-i", str(subs), "-map", "0:v", "-map", "0:a?", "-map", "1:s",
+                "-c", "copy", "-c:s", "mov_text", "-disposition:s:0", "default", "-f", "mp4", "-y", str(out)]
+    return ([FFMPEG_PATH, "-i", str(path), "-vf", vf] + encoder_args(path, profile, codec=codec, track=track) +
+            ["-f", "mp4", "-y", str(out)])
+
+def encode_overlay(path, out, metadata, profile=None, startupinfo=None, on_progress=None, on_encode=None, track=None):
+    """Burn the overlay for metadata into path, writing out. Returns (returncode, stderr).
+
+    Long clips are encoded in segments when OVERLAY_SEGMENTS asks for it.
+    on_encode is called once an encode slot has been taken. track is the
+    source's Mp4Track if the caller has parsed it, so it isn't parsed again.
+    """
+    cam = metadata.camera or "NO CAMERA NAME"
+    ts_start = metadata.start_time or "00:00:00"
+    date_display, timeline = metadata.date_display, metadata.timeline
+    log(f"Camera: {cam}, Date: {date_display}, Start time: {ts_start}")
+    track = track or read_mp4_track(path)
+    vf, subs = prepare_overlay(path, cam, date_display, ts_start, timeline, track)
+    try:
+        cmd = overlay_command(path, out, vf, subs, metadata.codec, profile, track)
+        log(f"FFmpeg command: {' '.join(cmd)}")
+        if vf is None:
+            # Soft subtitle track: a remux with every stream copied, no encode slot needed
+            return _run_ffmpeg(cmd, startupinfo=startupinfo, on_progress=on_progress)
+        log(f"Video filter: {vf}")
+
+        # Encode stage: CPU bound, limited to ENCODE_CONCURRENCY at once
+        with _encode_slots:
+            if on_encode:
+                on_encode()
+            plan = plan_segments(path, track=track)
+            # Every segment is an encode of its own: beyond this file's slot,
+            # take one per extra segment, as many as are free right now
+            extra = _encode_slots.acquire_free(len(plan[0]) - 1) if plan else 0
+            try:
+                if plan and extra + 1 < len(plan[0]):
+                    log(f"  {extra} more encode slot(s) free, encoding in {extra + 1} segment(s)")
+                    plan = plan_segments(path, count=extra + 1, track=track)
+                if plan:
+                    h, m, sec = map(int, ts_start.split(':'))
+                    returncode, stderr = burn_segmented(
+                        path, out, plan,
+                        lambda tl: prepare_overlay(path, cam, date_display, ts_start, tl, track),
+                        timeline or Timeline.linear(h * 3600 + m * 60 + sec),
+                        startupinfo=startupinfo, on_progress=on_progress, profile=profile, track=track)
+                    if returncode == 0:
+                        return returncode, stderr
+                    log(f"  Segmented encode failed, encoding {path.name} in one piece")
+            finally:
+                _encode_slots.release(extra)
+            return _run_ffmpeg(cmd, startupinfo=startupinfo, on_progress=on_progress)
+    finally:
+        if subs:
+            subs.unlink(missing_ok=True)
+
+def _process_file(path, progress_data, has_output=None):
+    log(f"Processing: {path.name}")
+    
+    # Determine output directory - always use same directory as source file
+    output_dir = path.parent / "with_overlay"
+    expected_output = output_dir / (path.stem + "_overlay.mp4")
+    
+    index = get_index()
+    if has_output is None:
+        has_output = expected_output.exists()
+    if has_output:
+        complete = index.output_is_complete(path, expected_output) if index else mp4_is_complete(expected_output)
+        if complete:
+            log(f"Skipping {path.name} - overlay already exists at {expected_output.relative_to(path.parent)}")
+            if progress_data is not None:
+                with progress_lock:
+                    progress_data['skipped'] += 1
+                    progress_data['skipped_files'].append(path.name)
+            return "skipped"
+        log(f"Existing {expected_output.name} is incomplete or corrupt - burning it again")
+    if _leases is not None:
+        failure = _leases.failure(expected_output)
+        if failure and failure["attempts"] >= WORKER_ATTEMPTS:
+            last_error = "".join(str(failure.get("error", "")).strip().splitlines()[-1:])
+            log(f"Skipping {path.name} - failed {failure['attempts']} time(s), last on {failure.get('worker')}: "
+                f"{last_error}. Delete "
+                f"{_leases.failure_path(expected_output).name} to try it again")
+            if progress_data is not None:
+                with progress_lock:
+                    progress_data['failed'] += 1
+            return "failed"
+        if not _leases.claim(expected_output):
+            log(f"{path.name} is being burned by {_leases.holder(expected_output)}, checking it again later")
+            return "leased"
+        if not has_output and expected_output.exists():
+            # Another worker renamed its finished output into place just before the claim
+            log(f"Skipping {path.name} - another worker has just burned it")
+            if index:
+                index.record_output(path, expected_output, "done")
+            if progress_data is not None:
+                with progress_lock:
+                    progress_data['skipped'] += 1
+                    progress_data['skipped_files'].append(path.name)
+            return "skipped"
+    
+    log(f"Starting SEI extraction with debug logging...")
+    log(f"Using ffmpeg: {FFMPEG_PATH}")
+    
+    import time
+    start_time = time.time()
+    
+    startupinfo = hidden_console()
+    
+    # Create output directory 'with_overlay' in the same folder as the input video
+    try:
+        output_dir.mkdir(exist_ok=True)
+        log(f"Output directory: {output_dir}")
+    except PermissionError:
+        error_msg = f"ERROR: Cannot create directory {output_dir} - permission denied"
+        log(error_msg)
+        if not _headless:
+            subprocess.run([
+                "osascript", "-e",
+                f'display dialog "Permission Error\\n\\nCannot create output folder:\\n{output_dir}\\n\\nPlease check folder permissions." buttons {{"OK"}} with title "Overlay Burner Error" with icon stop'
+            ])
+        return
+    except Exception as e:
+        error_msg = f"ERROR: Failed to create directory {output_dir}: {e}"
+        log(error_msg)
+        if not _headless:
+            subprocess.run([
+                "osascript", "-e",
+                f'display dialog "Error Creating Folder\\n\\n{str(e)}\\n\\nCannot create output folder at:\\n{output_dir}" buttons {{"OK"}} with title "Overlay Burner Error" with icon stop'
+            ])
+        return
+    
+    out = output_dir / (path.stem + "_overlay.mp4")
+    # ffmpeg writes next to the output and the result is renamed into place
+    # once it is complete, so an interrupted run never leaves a partial
+    # <stem>_overlay.mp4 behind
+    part = out.with_name(out.name + (f".{_leases.worker_id}.part" if _leases else ".part"))
+    date_display = date_from_filename(path)
+    # The sample tables are parsed once here and handed to every stage below
+    track = read_mp4_track(path)
+    codec = video_codec(path, startupinfo, track)
+    if codec != "h264":
+        log(f"Source video codec: {codec}")
+    
+    # Probe stage: I/O bound, many may run at once. Unchanged files reuse the
+    # metadata recorded in the index and skip probing entirely.
+    cached = index.lookup(path) if index else None
+    probed = False
+    timeline = None
+    bytes_read = 0
+    probe_start = time.time()
+    if cached is not None and cached['probed']:
+        cam, ts_start = cached['camera'], cached['start_time']
+        if USE_TIMELINE and cached['timeline']:
+            timeline = Timeline.from_segments(json.loads(cached['timeline']))
+        probed = True
+        log(f"Metadata from index: cam='{cam}', time={ts_start}")
+    else:
+        with _probe_slots:
+            if index:
+                index.record_state(path, "probing")
+            pipe = not SINGLE_PASS or renderer() == "soft"
+            cam, ts_start, timeline, bytes_read = read_metadata(path, codec, startupinfo, pipe=pipe, track=track)
+            probed = ts_start is not None or pipe
+        if index and probed:
+            index.record_probe(path, cam, ts_start, date_display, mp4_duration(path, track), timeline)
+    probe_ms = int((time.time() - probe_start) * 1000)
+    encode_start = time.time()
+    duration = (cached['duration'] if cached is not None else None) or mp4_duration(path, track)
+    on_progress = job_progress(progress_data, path, duration)
+
+    if probed:
+        metadata = Metadata(cam, ts_start, date_display, codec, duration, timeline)
+        on_encode = (lambda: index.record_state(path, "encoding")) if index else None
+        returncode, stderr = encode_overlay(path, part, metadata, startupinfo=startupinfo,
+                                            on_progress=on_progress, on_encode=on_encode, track=track)
+    else:
+        # Metadata wasn't in the MP4 sample table - probe and encode from one read of the file
+        with _encode_slots:
+            if index:
+                index.record_state(path, "encoding")
+            returncode, stderr, cam, ts_start, bytes_read = burn_single_pass(path, part, date_display, startupinfo=startupinfo,
+                                                                         on_progress=on_progress, codec=codec, track=track)
+        if index and returncode == 0:
+            index.record_probe(path, cam, ts_start, date_display, mp4_duration(path, track))
+    
+    elapsed = time.time() - start_time
+    encode_ms = int((time.time() - encode_start) * 1000)
+    timings = dict(event="file_done", probe_ms=probe_ms, encode_ms=encode_ms, bytes_read=bytes_read,
+                   source_bytes=path.stat().st_size, total_ms=int(elapsed * 1000))
+    
+    if _leases is not None and not _leases.holds(out):
+        # Another worker took the file over while this one was slow; its output wins
+        log(f"Lost the lease on {out.name} to another worker, discarding this encode")
+        try:
+            part.unlink(missing_ok=True)
+        except OSError:
+            pass
+        return "leased"
+    if returncode == 0:
+        try:
+            commit_output(part, out)
+        except OSError as e:
+            returncode, stderr = -1, f"Could not move {part.name} into place: {e}".encode()
+    if returncode == 0:
+        if _leases is not None:
+            _leases.clear_failure(out)
+        _encode_slots.record(timings['source_bytes'])
+        log(f"Created: {out.name} in {output_dir.name}/ (took {elapsed:.1f}s)")
+        log(f"Timing: probe {probe_ms} ms, encode {encode_ms} ms, {bytes_read} bytes probed",
+            status="success", **timings)
+        if QUALITY_CHECK:
+            psnr, ssim = quality_check(path, out, startupinfo=startupinfo)
+            log(f"Quality above the overlay band: PSNR {psnr} dB, SSIM {ssim}")
+        if index:
+            index.record_output(path, out, "done")
+        if progress_data is not None:
+            with progress_lock:
+                progress_data['success'] += 1
+        return "success"
+    else:
+        err = stderr.decode(errors='ignore')
+        log(f"FFmpeg error (full output):")
+        log(err)
+        try:
+            part.unlink()
+        except OSError:
+            pass
+        if index:
+            index.record_output(path, out, "failed")
+        if _leases is not None:
+            attempts = _leases.record_failure(out, err)
+            log(f"Failure {attempts} of {WORKER_ATTEMPTS} recorded in {_leases.failure_path(out).name}")
+        log(f"Timing: probe {probe_ms} ms, encode {encode_ms} ms, {bytes_read} bytes probed",
+            status="failed", **timings)
+        if progress_data is not None:
+            with progress_lock:
+                progress_data['failed'] += 1
+        return "failed"
+
+# Library API: probe() and burn() run the batch's pipeline on one file for
+# programs that import this module, without the progress window, index,
+# journal or leases, and report through return values instead of
+# progress_data. probe_async() and burn_async() do the same from asyncio code,
+# with ffmpeg started through asyncio.create_subprocess_exec.
+Metadata = namedtuple("Metadata", "camera start_time date_display codec duration timeline")
+Metadata.__doc__ = """A recording's Dividia metadata. camera and start_time are None if none was found."""
+Result = namedtuple("Result", "status output returncode error elapsed")
+Result.__doc__ = """Outcome of burn(): status is "success" or "failed", error ffmpeg's output on failure."""
+
+def probe(path):
+    """Read the Dividia metadata of the recording at path"""
+    path = Path(path)
+    startupinfo = hidden_console()
+    track = read_mp4_track(path)
+    codec = video_codec(path, startupinfo, track)
+    with _probe_slots:
+        cam, ts_start, timeline, _ = read_metadata(path, codec, startupinfo, track=track)
+    return Metadata(cam, ts_start, date_from_filename(path), codec, mp4_duration(path, track), timeline)
+
+def _output_paths(path, output):
+    out = Path(output) if output else path.parent / "with_overlay" / (path.stem + "_overlay.mp4")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    return out, out.with_name(out.name + ".part")
+
+def _result(out, part, returncode, stderr, start_time):
+    if returncode == 0:
+        try:
+            commit_output(part, out)
+        except OSError as e:
+            returncode, stderr = -1, f"Could not move {part.name} into place: {e}".encode()
+    if returncode != 0:
+        part.unlink(missing_ok=True)
+    return Result("success" if returncode == 0 else "failed", out, returncode,
+                  stderr.decode(errors='ignore') if returncode != 0 else "", time.time() - start_time)
+
+def burn(path, metadata=None, output=None, profile=None, on_progress=None):
+    """Burn the overlay into the recording at path and return a Result.
+
+    metadata comes from probe() (probed here if not given). The output goes
+    to output, by default with_overlay/<stem>_overlay.mp4 next to the source,
+    and only appears once it is complete. profile picks an encoder profile
+    for this call; on_progress gets ffmpeg's -progress reports as dicts.
+    """
+    path = Path(path)
+    start_time = time.time()
+    metadata = metadata or probe(path)
+    out, part = _output_paths(path, output)
+    returncode, stderr = encode_overlay(path, part, metadata, profile=profile, startupinfo=hidden_console(),
+                                        on_progress=on_progress)
+    return _result(out, part, returncode, stderr, start_time)
+
+async def _run_ffmpeg_async(cmd, on_progress=None):
+    """_run_ffmpeg() for asyncio: ffmpeg is killed if the awaiting task is cancelled"""
+    import asyncio
+    if on_progress is not None:
+        cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE if on_progress else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE, startupinfo=hidden_console())
+    try:
+        stderr = asyncio.ensure_future(proc.stderr.read())
+        if on_progress is not None:
+            report = {}
+            async for line in proc.stdout:
+                key, _, value = line.decode(errors='ignore').strip().partition('=')
+                if key == "progress":
+                    on_progress(report)
+                    report = {}
+                elif key:
+                    report[key] = value.strip()
+        return await proc.wait(), await stderr
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+async def _probe_sei_async(path, codec):
+    """probe_sei() for asyncio, always stopping at the first metadata record"""
+    import asyncio
+    proc = await asyncio.create_subprocess_exec(
+        FFMPEG_PATH, "-i", str(path), "-c:v", "copy", "-bsf:v", CODECS[codec]["bsf"], "-f", CODECS[codec]["format"], "-",
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL, startupinfo=hidden_console())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PROBE_TIMEOUT if PROBE_TIMEOUT > 0 else None
+    scanner = SeiScanner(codec=codec)
+    bytes_read = 0
+    try:
+        while True:
+            data = await asyncio.wait_for(proc.stdout.read(1048576),
+                                          None if deadline is None else max(0.0, deadline - loop.time()))
+            if not data:
+                break
+            bytes_read += len(data)
+            if scanner.feed(data):
+                return scanner.camera, scanner.start_time, bytes_read
+            if PROBE_MAX_BYTES > 0 and bytes_read >= PROBE_MAX_BYTES:
+                break
+    except asyncio.TimeoutError:
+        log(f"SEI probe of {path.name} gave up after its time budget of {PROBE_TIMEOUT:g}s")
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    return None, None, bytes_read
+
+async def probe_async(path):
+    """probe() for asyncio. File parsing runs in the default executor."""
+    import asyncio
+    path = Path(path)
+    loop = asyncio.get_running_loop()
+    codec = await loop.run_in_executor(None, video_codec, path)
+    cam, ts_start, timeline, _ = await loop.run_in_executor(None, read_metadata, path, codec, None, False)
+    if not ts_start:
+        cam, ts_start, _ = await _probe_sei_async(path, codec)
+    duration = await loop.run_in_executor(None, mp4_duration, path)
+    return Metadata(cam, ts_start, date_from_filename(path), codec, duration, timeline)
+
+async def burn_async(path, metadata=None, output=None, profile=None, on_progress=None):
+    """burn() for asyncio.
+
+    Every clip is encoded in one piece by a single ffmpeg, and the encode
+    concurrency is left to the caller (an asyncio.Semaphore, for instance),
+    since the event loop can't wait on the batch's encode slots.
+    """
+    import asyncio
+    path = Path(path)
+    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    metadata = metadata or await probe_async(path)
+    out, part = _output_paths(path, output)
+    vf, subs = await loop.run_in_executor(None, prepare_overlay, path, metadata.camera or "NO CAMERA NAME",
+                                          metadata.date_display, metadata.start_time or "00:00:00", metadata.timeline)
+    try:
+        # Choosing the encoder settings can read the calibration file and the source, or run ffmpeg
+        cmd = await loop.run_in_executor(None, overlay_command, path, part, vf, subs, metadata.codec, profile)
+        returncode, stderr = await _run_ffmpeg_async(cmd, on_progress)
+    except asyncio.CancelledError:
+        part.unlink(missing_ok=True)
+        raise
+    finally:
+        if subs:
+            subs.unlink(missing_ok=True)
+    return await loop.run_in_executor(None, _result, out, part, returncode, stderr, start_time)
+
+def write_progress_file(progress_log, progress_data, active):
+    """macOS: write the progress screen shown by the Terminal window"""
+    total = progress_data['total']
+    completed = progress_data['success'] + progress_data['skipped'] + progress_data['failed']
+    pct = int(completed / total * 100) if completed > 0 else 0
+    with open(progress_log, 'w', encoding='utf-8') as f:
+        f.write(f"\n\n\n")
+        f.write(f"{'=' * 60}\n")
+        f.write(f"{'OVERLAY BURNER PROGRESS'.center(60)}\n")
+        f.write(f"{'=' * 60}\n\n")
+        found = f"{total}+ (still searching)" if progress_data.get('searching') else f"{total}"
+        f.write(f"  Processing file {progress_data['current']} of {found}\n\n")
+        if active:
+            for name in active[:6]:
+                f.write(f"  Current: {name}\n")
+            if len(active) > 6:
+                f.write(f"           (+{len(active) - 6} more)\n")
+            f.write(f"\n")
+        else:
+            f.write(f"  Current: {progress_data['current_file']}\n\n")
+        
+        # Progress bar
+        bar_length = 50
+        filled = int(bar_length * completed / total) if completed > 0 else 0
+        bar = '#' * filled + '-' * (bar_length - filled)
+        f.write(f"  {bar} {pct}%\n\n")
+        
+        f.write(f"  [  OK  ] Completed: {progress_data['success']}\n")
+        f.write(f"  [ SKIP ] Skipped:   {progress_data['skipped']}\n")
+        f.write(f"  [ FAIL ] Failed:    {progress_data['failed']}\n\n")
+        
+        if progress_data['est_time']:
+            f.write(f"  [ETA] Estimated time remaining: {progress_data['est_time']}\n\n")
+        else:
+            f.write(f"\n")
+
+def _is_source_video(name):
+    lower = name.lower()
+    return lower.endswith(".mp4") and "_overlay.mp4" not in lower
+
+class FolderWatcher:
+    """Reports new or changed source videos under a set of folders.
+
+    Uses inotify on Linux (through ctypes, no extra packages) and otherwise,
+    or if inotify can't be set up, rescans the folders every
+    WATCH_POLL_INTERVAL seconds. with_overlay/ folders are never watched.
+    The first poll() reports every video already there.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+
+    def __init__(self, roots):
+        self.roots = [Path(r) for r in roots]
+        self._seen = {}      # Poll mode: path -> (size, mtime_ns) at the last scan
+        self._watches = {}   # inotify watch descriptor -> directory
+        self._fd = None
+        self._next_scan = 0.0
+        self._initial = None
+        if sys.platform.startswith("linux"):
+            try:
+                self._init_inotify()
+            except (OSError, AttributeError) as e:
+                log(f"WARNING: inotify unavailable ({e}), polling instead")
+        self.mode = "inotify" if self._fd is not None else "poll"
+
+    def _init_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._libc, self._fd = libc, fd
+        self._initial = set()
+        for root in self.roots:
+            self._initial.update(self._scan(root, watch=True))
+
+    def _scan(self, directory, watch=False):
+        """Videos under directory as {path: (size, mtime_ns)}, adding inotify watches if asked"""
+        found = {}
+        if watch:
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), mask)
+            if wd < 0:
+                log(f"WARNING: Cannot watch {directory}: {os.strerror(ctypes.get_errno())}")
+            else:
+                self._watches[wd] = Path(directory)
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir() and not entry.is_symlink():
+                        if entry.name != "with_overlay":
+                            found.update(self._scan(entry.path, watch))
+                    elif _is_source_video(entry.name):
+                        st = entry.stat()
+                        found[Path(entry.path)] = (st.st_size, st.st_mtime_ns)
+        except OSError as e:
+            log(f"WARNING: Could not list {directory}: {e}")
+        return found
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds and return the set of videos that appeared or changed"""
+        if self._fd is None:
+            wait_for = self._next_scan - time.time()
+            if wait_for > 0:
+                time.sleep(min(timeout, wait_for))
+                return set()
+            self._next_scan = time.time() + WATCH_POLL_INTERVAL
+            current = {}
+            for root in self.roots:
+                current.update(self._scan(root))
+            changed = {path for path, sig in current.items() if self._seen.get(path) != sig}
+            self._seen = current
+            return changed
+
+        if self._initial is not None:
+            changed, self._initial = self._initial, None
+            return changed
+        changed = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return changed
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos + 16 <= len(data):
+            wd, mask, _, length = struct.unpack_from('iIII', data, pos)
+            name = os.fsdecode(data[pos + 16:pos + 16 + length].split(b'\x00', 1)[0])
+            pos += 16 + length
+            if mask & self.IN_Q_OVERFLOW:
+                log("WARNING: Watch event queue overflowed, rescanning")
+                for root in self.roots:
+                    changed.update(self._scan(root))
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & self.IN_ISDIR:
+                if name != "with_overlay":
+                    # New folder: watch it and pick up anything written before the watch existed
+                    changed.update(self._scan(directory / name, watch=True))
+            elif _is_source_video(name):
+                changed.add(directory / name)
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+def write_watch_status(status):
+    """Atomically replace WATCH_STATUS_FILE with the status as JSON"""
+    tmp = WATCH_STATUS_FILE.with_name(WATCH_STATUS_FILE.name + ".tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(status, f, indent=2)
+        os.replace(tmp, WATCH_STATUS_FILE)
+    except OSError as e:
+        log(f"WARNING: Could not write {WATCH_STATUS_FILE}: {e}")
+
+def serve_watch_status(port, get_status):
+    """Serve get_status() as JSON on http://127.0.0.1:port/ from a background thread"""
+    import http.server  # Only needed in watch mode; keeps the import of this module quick
+    class StatusHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(get_status(), indent=2).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep polling clients out of the log
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), StatusHandler)
+    threading.Thread(target=server.serve_forever, name="status-http", daemon=True).start()
+    return server
+
+def watch(roots):
+    """Run until stopped, burning overlays onto videos as they land in roots.
+
+    Files go through three stages: settling (still being written), queued,
+    and running. At most BATCH_WORKERS files run at once; the rest wait in
+    the queue, so a burst of exports can't start unbounded work.
+    """
+    watcher = FolderWatcher(roots)
+    log(f"Watching {len(roots)} folder(s) using {watcher.mode}: {', '.join(str(r) for r in roots)}")
+    resumed = unfinished_jobs(roots)
+
+    stop = threading.Event()
+    def request_stop(signum, frame):
+        log(f"Received signal {signum}, stopping after the running jobs")
+        stop.set()
+    signal.signal(signal.SIGTERM, request_stop)
+
+    progress_data = {
+        'total': 0,
+        'current': 0,
+        'current_file': '',
+        'success': 0,
+        'skipped': 0,
+        'failed': 0,
+        'est_time': '',
+        'skipped_files': deque(maxlen=100),
+        'active': [],
+        'jobs': {}
+    }
+    settling = {}              # path -> ((size, mtime_ns), time it last changed)
+    incomplete = set()         # Settled files that aren't valid MP4s yet (logged once)
+    queued = deque(path for path, _ in resumed)  # Jobs a previous run was cut off in go first
+    leased = {}                # Files another --worker is burning -> when to check them again
+    running = {}               # future -> path
+    recent = deque(maxlen=50)  # (time, file, result) of finished jobs
+    started = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    def status():
+        with progress_lock:
+            jobs = list(progress_data['jobs'].values())
+            counts = {k: progress_data[k] for k in ('success', 'skipped', 'failed')}
+        return {
+            "pid": os.getpid(), "started": started, "updated": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "mode": watcher.mode, "folders": [str(r) for r in roots],
+            "settling": len(settling), "queued": len(queued), "leased_elsewhere": len(leased),
+            "running": [str(p) for p in running.values()], "jobs": jobs,
+            **counts, "recent": list(recent),
+        }
+
+    server = None
+    if WATCH_STATUS_PORT:
+        try:
+            server = serve_watch_status(WATCH_STATUS_PORT, status)
+            log(f"Status endpoint: http://127.0.0.1:{WATCH_STATUS_PORT}/")
+        except OSError as e:
+            log(f"WARNING: Could not start the status endpoint on port {WATCH_STATUS_PORT}: {e}")
+
+    index = get_index()
+    monitor = start_load_monitor()
+    pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+    next_status = 0.0
+    try:
+        while not stop.is_set():
+            now = time.time()
+            for path in watcher.poll(timeout=1.0):
+                if path not in queued and path not in running.values():
+                    settling.setdefault(path, (None, now))
+
+            # Debounce: a file is ready once it stops changing and its MP4 structure is complete
+            now = time.time()
+            for path, (sig, since) in list(settling.items()):
+                try:
+                    st = path.stat()
+                except OSError:
+                    del settling[path]  # Moved away or deleted
+                    continue
+                current = (st.st_size, st.st_mtime_ns)
+                if current != sig:
+                    settling[path] = (current, now)
+                elif now - since >= WATCH_SETTLE:
+                    if mp4_is_complete(path):
+                        del settling[path]
+                        incomplete.discard(path)
+                        queued.append(path)
+                        if index and not (path.parent / "with_overlay" / (path.stem + "_overlay.mp4")).exists():
+                            index.record_queued([(path, st)])
+                        log(f"Queued {path}")
+                    else:
+                        if path not in incomplete:
+                            log(f"{path.name} is not a complete MP4 yet, waiting for it to change")
+                            incomplete.add(path)
+                        settling[path] = (current, now)
+
+            for path, retry in list(leased.items()):
+                if now >= retry:
+                    del leased[path]
+                    queued.append(path)
+
+            # Back-pressure: only as many jobs in flight as there are workers
+            while queued and len(running) < BATCH_WORKERS:
+                path = queued.popleft()
+                with progress_lock:
+                    progress_data['total'] += 1
+                running[pool.submit(process, path, progress_data['total'], progress_data['total'], progress_data)] = path
+
+            for fut in [f for f in running if f.done()]:
+                path = running.pop(fut)
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    log(f"ERROR: {path.name} failed unexpectedly: {e}")
+                    with progress_lock:
+                        progress_data['failed'] += 1
+                    result = "failed"
+                if result == "leased":
+                    leased[path] = time.time() + min(LEASE_SECONDS / 4, 30)
+                    with progress_lock:
+                        progress_data['total'] -= 1
+                    continue
+                recent.append((time.strftime('%Y-%m-%d %H:%M:%S'), str(path), result))
+
+            if time.time() >= next_status:
+                write_watch_status(status())
+                next_status = time.time() + WATCH_STATUS_INTERVAL
+    except KeyboardInterrupt:
+        log("Interrupted, stopping")
+    finally:
+        # Let running encodes finish so no half-written outputs are left behind
+        log(f"Waiting for {len(running)} running job(s); {len(queued)} queued file(s) will be picked up next start")
+        pool.shutdown(wait=True)
+        if monitor:
+            monitor.stop()
+        watcher.close()
+        if server:
+            server.shutdown()
+        write_watch_status(dict(status(), stopped=True))
+        log("Watch mode stopped")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Burn Dividia camera metadata overlays into MP4 videos")
+    parser.add_argument("selection", nargs="?",
+                        help="comma-separated files/folders to process (default: the current folder)")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="benchmark the encoder profiles on a sample from the selection and save the best one")
+    parser.add_argument("--target-fps", type=float, default=None,
+                        help=f"encode speed --calibrate must reach (default {TARGET_FPS:g})")
+    parser.add_argument("--profile", choices=sorted(ENCODER_PROFILES),
+                        help="encoder profile for this run (overrides calibration)")
+    parser.add_argument("--compare-modes", action="store_true",
+                        help="encode a sample in each render mode and report speed, size and PSNR/SSIM")
+    parser.add_argument("--mosaic", action="store_true",
+                        help="tile the selected clips, one tile per camera and time-aligned by their metadata, "
+                             "into a single video with an overlay on each tile")
+    parser.add_argument("--window", metavar="HH:MM:SS-HH:MM:SS",
+                        help="--mosaic: time of day to cover (default: from the first clip's start to the last one's end)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and burn overlays onto new videos as they appear in the selected folders")
+    parser.add_argument("--worker", action="store_true",
+                        help="share the selected folders with other instances started with --worker, "
+                             "on this or other machines, claiming files through lease files in with_overlay/")
+    parser.add_argument("--stream", nargs="?", const="-", metavar="PIPE",
+                        help="read one clip (MP4 with its moov first, or Annex B) from stdin or the named pipe PIPE "
+                             "and write it with the overlay burned in to stdout as fragmented MP4; logs go to stderr")
+    parser.add_argument("--name", help="--stream: the clip's original file name, for the date in the overlay")
+    parser.add_argument("--headless", action="store_true",
+                        help="run without the progress window, Terminal or dialogs; progress goes to the log only")
+    return parser.parse_args(argv)
+
+def main():
+    global ENCODER_PROFILE, _leases, _log_to_stderr, _headless
+    args = parse_args()
+    _log_to_stderr = args.stream is not None
+    _headless = args.headless
+    log("=== Overlay Burner Started ===")
+    log(f"Arguments received: {sys.argv}")
     log(f"Number of arguments: {len(sys.argv)}")
+    if args.profile:
+        ENCODER_PROFILE = args.profile
+    apply_process_priority()
+    if args.worker:
+        _leases = LeaseQueue(WORKER_ID, LEASE_SECONDS)
+        log(f"Worker {_leases.worker_id}: claiming files through leases that expire after {LEASE_SECONDS:g}s")
+    if args.stream is not None:
+        if args.stream == "-":
+            sys.exit(burn_stream(sys.stdin.buffer, args.name, hidden_console()))
+        with open(args.stream, 'rb') as source:
+            sys.exit(burn_stream(source, args.name or Path(args.stream).name, hidden_console()))
     
     # Get the folder where the app/script is located
     if getattr(sys, 'frozen', False):
@@ -463,63 +3639,91 @@ def main():
     log(f"Folder: {folder}")
 
     # Check if specific items (files/folders) were passed as arguments
-    videos = []
+    roots = []
+    files = []
     
-    if len(sys.argv) > 1:
+    if args.selection:
         # Parse selection from argument (comma-separated paths from AppleScript)
-        selection_str = sys.argv[1]
+        selection_str = args.selection
         selected_paths = [p.strip() for p in selection_str.split(',') if p.strip()]
         
         # Process each selected item
         for path_str in selected_paths:
             path = Path(path_str).resolve()  # Convert to absolute path
             if path.is_dir():
-                # It's a folder - collect all videos recursively (resolve to absolute paths)
-                folder_videos = [p.resolve() for p in path.rglob("*.mp4") if "_overlay.mp4" not in p.name.lower()]
-                videos.extend(folder_videos)
-                log(f"Found {len(folder_videos)} video(s) in folder: {path}")
-                # Debug: log the actual paths
-                for v in folder_videos[:2]:  # Log first 2
-                    log(f"  Video path: {v} (parent: {v.parent})")
+                # It's a folder - searched recursively in the background
+                roots.append(path)
+                log(f"Searching folder: {path}")
             elif path.is_file() and path.suffix.lower() == '.mp4' and '_overlay.mp4' not in path.name.lower():
                 # It's a video file
-                videos.append(path.resolve())
+                files.append(path)
                 log(f"Added file: {path}")
-        
-        log(f"Processing {len(videos)} selected video(s)")
     else:
         # No arguments - process all videos in current folder
-        videos = [p for p in folder.rglob("*.mp4") if "_overlay.mp4" not in p.name.lower()]
-        log(f"Found {len(videos)} video(s) in folder")
+        roots.append(folder)
+    
+    if args.watch:
+        if files:
+            log(f"Watch mode only watches folders - ignoring {len(files)} selected file(s)")
+        if not roots:
+            user_pause("No folders", "Watch mode needs at least one folder")
+            return
+        watch(roots)
+        return
     
-    if not videos:
+    # Videos stream in from the search; processing starts with the first one
+    discovery_start = time.time()
+    discovery = VideoDiscovery(roots, files)
+    first = discovery.take(timeout=0.5)
+    while not first and not discovery.finished:
+        first = discovery.take(timeout=0.5)
+    if not first:
         user_pause("No videos", f"No .mp4 files to process")
         return
-
-    log(f"Total videos to process: {len(videos)}")
     
-    import time
+    if args.calibrate or args.compare_modes or args.mosaic:
+        videos = [path for path, _, _ in first + discovery.take_all()]
+        log(f"Total videos found: {len(videos)}")
+        if args.calibrate:
+            calibrate(videos, target_fps=args.target_fps)
+        elif args.compare_modes:
+            compare_render_modes(videos)
+        else:
+            burn_mosaic(videos, window=args.window)
+        return
+    log(f"Encoder profile: {default_encoder_profile()}, render mode: {render_mode()}, renderer: {renderer()}")
+    if RENDER_MODE == "band" and render_mode() != "band":
+        log("  Band mode hasn't been approved by --compare-modes on this machine, encoding in full mode")
+    # Jobs a previous run was cut off in go first; discovery finds them again later
+    resumed = unfinished_jobs(roots, files)
+    resumed_paths = {path for path, _ in resumed}
+    
     total_start = time.time()
-    processing_times = []
     
     # Progress tracking data
     progress_data = {
-        'total': len(videos),
+        'total': discovery.count,
+        'searching': not discovery.finished,
         'current': 0,
         'current_file': '',
         'success': 0,
         'skipped': 0,
         'failed': 0,
         'est_time': '',
-        'skipped_files': []  # Track which files were skipped
+        'skipped_files': [],  # Track which files were skipped
+        'active': [],         # Files currently being processed by workers
+        'jobs': {}            # Live ffmpeg progress of running jobs, by path
     }
     
     # Create progress window/log based on platform
     progress_window = None
-    if platform.system() == 'Windows':
+    progress_log = None
+    if _headless:
+        pass
+    elif platform.system() == 'Windows':
         # Windows: Show GUI immediately in "preparing" state
         progress_window = ProgressWindow()
-        progress_window.start_processing(len(videos))
+        progress_window.start_processing(discovery.count)
     else:
         # macOS: Use Terminal window with progress file
         progress_log = Path("/tmp/overlay_burner_progress.txt")
@@ -531,65 +3735,125 @@ def main():
         ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         time.sleep(1)  # Give Terminal time to open
     
-    for idx, v in enumerate(videos, 1):
+    def refresh_progress():
+        """Redraw the Windows window or macOS progress file from progress_data (main thread only)"""
+        with progress_lock:
+            snapshot = dict(progress_data, active=list(progress_data.get('active', [])))
+        jobs = {job['name']: job for job in snapshot['jobs'].values()}
+        active = [job_label(jobs[name]) if name in jobs else name for name in snapshot['active']]
+        current = active[0] if active else snapshot['current_file']
+        if len(active) > 1:
+            current += f" (+{len(active) - 1} more)"
+        if platform.system() == 'Windows' and progress_window:
+            progress_window.update(snapshot['current'], current, snapshot['success'], snapshot['skipped'],
+                                   snapshot['failed'], snapshot['est_time'], snapshot['total'], snapshot['searching'])
+        elif progress_log:
+            write_progress_file(progress_log, snapshot, active)
+
+    # ETA is weighted by source size: finished files count in full and running
+    # encodes by the share of their clip already encoded, so one long clip in a
+    # batch of short ones is accounted for from the start
+    sizes = {}          # Source size of every submitted file, by path
+    work_total = 0      # Bytes of all submitted files that weren't skipped
+    work_done = 0       # Bytes of files finished (encoded or failed)
+    burned_bytes = 0    # Bytes of files encoded successfully, for the throughput summary
+    deferred = {}       # Files leased by other workers -> when to check them again
+
+    def update_eta():
+        with progress_lock:
+            jobs = dict(progress_data['jobs'])
+        running = sum(job['fraction'] * sizes.get(key, 0) for key, job in jobs.items() if job.get('fraction'))
+        elapsed = time.time() - total_start
+        if work_done + running <= 0 or elapsed < 2:
+            return
+        est_seconds = max(0, work_total - work_done - running) * elapsed / (work_done + running)
+        est_mins = int(est_seconds / 60)
+        est_secs = int(est_seconds % 60)
+        progress_data['est_time'] = f"{est_mins}m {est_secs}s" + (" (still searching)" if progress_data['searching'] else "")
+
+    log(f"Running {BATCH_WORKERS} worker(s): up to {PROBE_CONCURRENCY} probe(s) and {ENCODE_CONCURRENCY} encode(s) at once")
+    index = get_index()
+    monitor = start_load_monitor()
+    pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+    futures = {}
+    pending = set()
+    found = [(path, None, st) for path, st in resumed] + [item for item in first if item[0] not in resumed_paths]
+    while True:
+        if index and found:
+            # Files with an output are only checked and skipped - no journal entry
+            index.record_queued([(path, st) for path, has_output, st in found if not has_output and st])
+        for path, has_output, st in found:
+            size = st.st_size if st else 0
+            fut = pool.submit(process, path, len(futures) + 1, discovery.count, progress_data, has_output)
+            futures[fut] = path
+            pending.add(fut)
+            sizes[str(path)] = size
+            work_total += size
+        for path in [p for p, when in deferred.items() if when <= time.time()]:
+            del deferred[path]
+            fut = pool.submit(process, path, len(futures) + 1, discovery.count, progress_data)
+            futures[fut] = path
+            pending.add(fut)
+        if found or (discovery.finished and progress_data['searching']):
+            with progress_lock:
+                progress_data['total'] = discovery.count
+                progress_data['searching'] = not discovery.finished
+            if discovery.finished:
+                log(f"Search finished: {discovery.count} video(s) found in {time.time() - discovery_start:.1f}s")
+        if not pending and not deferred and discovery.finished:
+            break
+        update_eta()
+        refresh_progress()
+        
+        if pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+        else:
+            done = set()
+        found = [item for item in discovery.take(timeout=0 if pending else 0.5) if item[0] not in resumed_paths]
+        
         # Check if user closed window
         if platform.system() == 'Windows' and progress_window and progress_window.should_stop:
             log("Processing cancelled by user")
+            discovery.stop()
+            for fut in pending:
+                fut.cancel()
+            terminate_active_processes()
+            pool.shutdown(wait=True)
+            if monitor:
+                monitor.stop()
+            progress_window.close()
             return
         
-        # Update progress
-        completed = progress_data['success'] + progress_data['skipped'] + progress_data['failed']
-        
-        # Update Windows progress window or macOS progress file
-        if platform.system() == 'Windows' and progress_window:
-            progress_window.update(idx, v.name, progress_data['success'], progress_data['skipped'], progress_data['failed'], time.time() - total_start)
-        else:
-            # macOS: Write to progress file
-            pct = int(completed / len(videos) * 100) if completed > 0 else 0
-            with open(progress_log, 'w', encoding='utf-8') as f:
-                f.write(f"\n\n\n")
-                f.write(f"{'=' * 60}\n")
-                f.write(f"{'OVERLAY BURNER PROGRESS'.center(60)}\n")
-                f.write(f"{'=' * 60}\n\n")
-                f.write(f"  Processing file {idx} of {len(videos)}\n\n")
-                f.write(f"  Current: {v.name}\n\n")
-                
-                # Progress bar
-                bar_length = 50
-                filled = int(bar_length * completed / len(videos)) if completed > 0 else 0
-                bar = '#' * filled + '-' * (bar_length - filled)
-                f.write(f"  {bar} {pct}%\n\n")
-                
-                f.write(f"  [  OK  ] Completed: {progress_data['success']}\n")
-                f.write(f"  [ SKIP ] Skipped:   {progress_data['skipped']}\n")
-                f.write(f"  [ FAIL ] Failed:    {progress_data['failed']}\n\n")
-            
-            if progress_data['est_time']:
-                f.write(f"  [ETA] Estimated time remaining: {progress_data['est_time']}\n\n")
+        for fut in done:
+            try:
+                result = fut.result()
+            except Exception as e:
+                log(f"ERROR: {futures[fut].name} failed unexpectedly: {e}")
+                with progress_lock:
+                    progress_data['failed'] += 1
+                result = "failed"
+            if result == "leased":
+                deferred[futures[fut]] = time.time() + min(LEASE_SECONDS / 4, 30)
+                continue
+            size = sizes.get(str(futures[fut]), 0)
+            if result == "skipped":
+                work_total -= size  # Cost next to nothing - keep them out of the estimate
             else:
-                f.write(f"\n")
-        
-        log(f"[{idx}/{len(videos)}] Processing: {v.name}")
-        
-        file_start = time.time()
-        result = process(v, current_num=idx, total_num=len(videos), progress_data=progress_data)
-        
-        if result == "success":
-            file_elapsed = time.time() - file_start
-            processing_times.append(file_elapsed)
-            if platform.system() == 'Windows' and progress_window:
-                progress_window.add_processing_time(file_elapsed)
+                work_done += size
+            if result == "success":
+                burned_bytes += size
             
-            # Calculate estimated time remaining
-            if len(processing_times) > 0:
-                avg_time = sum(processing_times) / len(processing_times)
-                remaining = len(videos) - idx
-                est_seconds = avg_time * remaining
-                est_mins = int(est_seconds / 60)
-                est_secs = int(est_seconds % 60)
-                if remaining > 0:
-                    progress_data['est_time'] = f"{est_mins}m {est_secs}s"
-                    log(f"Progress: {idx}/{len(videos)} complete. Estimated time remaining: {est_mins}m {est_secs}s")
+            completed = progress_data['success'] + progress_data['skipped'] + progress_data['failed']
+            if result == "success" and discovery.count - completed > 0:
+                update_eta()
+                eta = f" Estimated time remaining: {progress_data['est_time']}" if progress_data['est_time'] else ""
+                log(f"Progress: {completed}/{discovery.count} complete.{eta}")
+    refresh_progress()
+    pool.shutdown()
+    if monitor:
+        monitor.stop()
+    if _leases:
+        _leases.close()
     
     # Final summary
     total_elapsed = time.time() - total_start
@@ -600,7 +3864,7 @@ def main():
     if platform.system() == 'Windows' and progress_window:
         total_elapsed = time.time() - total_start
         progress_window.show_complete(progress_data['success'], progress_data['skipped'], progress_data['failed'], total_elapsed)
-    else:
+    elif progress_log:
         # macOS: Write final progress with exit marker
         with open(progress_log, 'w', encoding='utf-8') as f:
             f.write(f"\n\n\n")
@@ -632,11 +3896,14 @@ def main():
         ], stderr=subprocess.DEVNULL)
     
     summary = f"[  OK  ] Success: {progress_data['success']}  [ SKIP ] Skipped: {progress_data['skipped']}  [ FAIL ] Failed: {progress_data['failed']}\n\nTotal time: {mins}m {secs}s"
+    throughput = throughput_summary(total_elapsed, burned_bytes, progress_data['success'])
+    if throughput:
+        summary += "\n" + throughput
     
     log(summary)
     
     # Only pause on macOS (interactive terminal). On Windows, batch file shows completion dialog.
-    if platform.system() == 'Darwin':
+    if platform.system() == 'Darwin' and not _headless:
         user_pause("Done", summary)
 
 if __name__ == "__main__":